@@ -0,0 +1,118 @@
+from datetime import datetime
+from typing import Optional
+from models import Tarefa, TarefaStatus
+from versoes import incrementar_versoes, carimbo_alteracao, liberar_reservas
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+VARREDURA_ATRASOS_INTERVALO_SEGUNDOS = int(os.getenv("VARREDURA_ATRASOS_INTERVALO", "300"))
+
+# Status que ainda podem virar "Atrasado"
+STATUS_EM_ABERTO = [
+    TarefaStatus.PENDENTE.value,
+    TarefaStatus.EM_ANDAMENTO.value,
+    TarefaStatus.AGUARDANDO.value,
+]
+
+
+class VarreduraAtrasos:
+    """
+    Varredura incremental de tarefas atrasadas
+
+    Guarda em `controle_varreduras` o último instante verificado (watermark).
+    Cada execução consulta apenas tarefas em aberto cujo prazo venceu entre
+    o watermark e agora, usando o índice (status, prazo), marca todas como
+    Atrasado de uma vez e dispara as notificações em lote.
+    """
+
+    CHAVE = "atrasos"
+
+    def __init__(self, db, gerador_notificacoes):
+        self.db = db
+        self.gerador_notificacoes = gerador_notificacoes
+
+    async def criar_indices(self):
+        """Índice usado pela consulta incremental"""
+        await self.db.tarefas.create_index([("status", 1), ("prazo", 1)])
+
+    async def executar(self, completa: bool = False) -> dict:
+        """
+        Executa uma rodada da varredura
+
+        - completa=True ignora o watermark (útil após alterar prazos retroativamente)
+        """
+        inicio = time.perf_counter()
+        agora = datetime.utcnow()
+        controle = await self.db.controle_varreduras.find_one({"_id": self.CHAVE}) or {}
+        watermark: Optional[str] = None if completa else controle.get('watermark')
+
+        filtro_prazo = {"$lte": agora.isoformat()}
+        if watermark:
+            filtro_prazo["$gt"] = watermark
+
+        tarefas = await self.db.tarefas.find(
+            {"status": {"$in": STATUS_EM_ABERTO}, "prazo": filtro_prazo},
+            {"_id": 0, "logs": 0}
+        ).to_list(None)
+
+        atrasadas = []
+        for tarefa in tarefas:
+            prazo = tarefa.get('prazo')
+            if isinstance(prazo, str):
+                prazo = datetime.fromisoformat(prazo.replace('Z', '+00:00'))
+            if prazo.tzinfo is not None:
+                prazo = prazo.replace(tzinfo=None)
+            atrasadas.append((Tarefa.construct(**tarefa), (agora - prazo).days))
+
+        marcadas = 0
+        enviadas = 0
+        if atrasadas:
+            try:
+                result = await self.db.tarefas.update_many(
+                    {"id": {"$in": [t.id for t, _ in atrasadas]}, "status": {"$in": STATUS_EM_ABERTO}},
+                    {"$set": {"status": TarefaStatus.ATRASADO.value, **await carimbo_alteracao(self.db)}}
+                )
+                marcadas = result.modified_count
+                if marcadas:
+                    await incrementar_versoes(self.db, "tarefas")
+            finally:
+                # Sem alteração (ou com erro) incrementar_versoes não roda: a reserva
+                # da sequência seguraria o cursor do sync até expirar
+                await liberar_reservas(self.db)
+            enviadas = await self.gerador_notificacoes.notificar_tarefas_atrasadas(atrasadas)
+
+        duracao_ms = round((time.perf_counter() - inicio) * 1000, 2)
+        estatisticas = {
+            "watermark": agora.isoformat(),
+            "ultima_execucao": agora.isoformat(),
+            "duracao_ms": duracao_ms,
+            "tarefas_verificadas": len(tarefas),
+            "tarefas_marcadas": marcadas,
+            "notificacoes_enviadas": enviadas,
+            "completa": completa
+        }
+
+        await self.db.controle_varreduras.update_one(
+            {"_id": self.CHAVE},
+            {
+                "$set": estatisticas,
+                "$inc": {
+                    "execucoes": 1,
+                    "total_tarefas_marcadas": marcadas,
+                    "total_notificacoes_enviadas": enviadas
+                }
+            },
+            upsert=True
+        )
+
+        if marcadas:
+            logger.info(f"Varredura de atrasos: {marcadas} tarefa(s) marcadas como atrasadas em {duracao_ms}ms")
+        return estatisticas
+
+    async def obter_estatisticas(self) -> dict:
+        """Estatísticas acumuladas e da última execução"""
+        controle = await self.db.controle_varreduras.find_one({"_id": self.CHAVE}, {"_id": 0})
+        return controle or {"execucoes": 0}
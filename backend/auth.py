@@ -1,18 +1,50 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
+from cache import CacheTTL
+from permissoes import mascara_usuario, tem_permissao
 import os
+import uuid
+import asyncio
+import hashlib
+import hmac
+import secrets
+import time
 
 # Configurações
 SECRET_KEY = os.getenv("SECRET_KEY", "ideiabh-secret-key-change-in-production-2025")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 dias
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+# Reapresentar um refresh token logo após a rotação não é roubo: abas do
+# mesmo navegador compartilham o token e renovam ao mesmo tempo
+REFRESH_TOKEN_GRACA_SEGUNDOS = int(os.getenv("REFRESH_TOKEN_GRACA_SEGUNDOS", "10"))
+SENHA_WORKERS = int(os.getenv("AUTH_SENHA_WORKERS", str(min(4, os.cpu_count() or 1))))
+SENHA_PROCESSOS = int(os.getenv("AUTH_SENHA_PROCESSOS", str(os.cpu_count() or 1)))
+CACHE_USUARIOS_TTL = float(os.getenv("AUTH_CACHE_USUARIOS_TTL", "30"))
+CACHE_USUARIOS_MAX = int(os.getenv("AUTH_CACHE_USUARIOS_MAX", "1000"))
+CACHE_TOKENS_MAX = int(os.getenv("AUTH_CACHE_TOKENS_MAX", "2000"))
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+oauth2_scheme_opcional = OAuth2PasswordBearer(tokenUrl="/api/auth/login", auto_error=False)
+api_key_header = APIKeyHeader(name="X-API-Key", auto_error=False)
+
+# bcrypt leva ~100-300ms por chamada; roda fora do event loop, em pool limitado
+senha_executor = ThreadPoolExecutor(max_workers=SENHA_WORKERS, thread_name_prefix="bcrypt")
+
+# Cadastro em lote: pool de processos criado só no primeiro uso
+senha_processos: Optional[ProcessPoolExecutor] = None
+
+# Usuários autenticados por id; invalidado pelas rotas de administração
+cache_usuarios = CacheTTL("usuarios", CACHE_USUARIOS_TTL, CACHE_USUARIOS_MAX)
+
+# Payloads de JWT já verificados, por hash do token; cada item vale até o `exp`
+cache_tokens = CacheTTL("tokens", ACCESS_TOKEN_EXPIRE_MINUTES * 60, CACHE_TOKENS_MAX)
 
 def hash_password(password: str) -> str:
     """Hash de senha usando bcrypt"""
@@ -22,6 +54,37 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica senha"""
     return pwd_context.verify(plain_password, hashed_password)
 
+async def hash_password_async(password: str) -> str:
+    """Hash de senha no pool de threads (não bloqueia o event loop)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(senha_executor, hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verifica senha no pool de threads (não bloqueia o event loop)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(senha_executor, verify_password, plain_password, hashed_password)
+
+async def hash_passwords_lote(senhas: List[str]) -> List[str]:
+    """
+    Hash de várias senhas em paralelo num pool de processos
+    
+    Usado no cadastro em lote, onde centenas de hashes seguidos ocupariam
+    o pool de threads do login por vários segundos.
+    """
+    global senha_processos
+    if senha_processos is None:
+        senha_processos = ProcessPoolExecutor(max_workers=SENHA_PROCESSOS)
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*[
+        loop.run_in_executor(senha_processos, hash_password, senha) for senha in senhas
+    ])
+
+def encerrar_pools_senha():
+    """Encerra os pools de hash (shutdown da aplicação)"""
+    senha_executor.shutdown(wait=False)
+    if senha_processos is not None:
+        senha_processos.shutdown(wait=False)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Cria token JWT"""
     to_encode = data.copy()
@@ -34,16 +97,191 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def criar_token_usuario(user: dict) -> str:
+    """
+    Cria access token de curta duração com as claims de autorização
+    
+    - role, ativo (at) e máscara de permissões (pm) vão no próprio token,
+      então as rotas protegidas não precisam ler o usuário no banco
+    """
+    return create_access_token(data={
+        "sub": user['id'],
+        "typ": "access",
+        "role": user.get('role'),
+        "at": user.get('ativo', True),
+        "pm": mascara_usuario(user)
+    })
+
+def _hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+async def criar_indices_auth(db):
+    """Índices dos refresh tokens (busca por hash e expiração por TTL)"""
+    await db.refresh_tokens.create_index("hash", unique=True)
+    await db.refresh_tokens.create_index("user_id")
+    await db.refresh_tokens.create_index("expira_em", expireAfterSeconds=0)
+
+async def migrar_permissoes_usuarios(db) -> int:
+    """Converte usuários antigos com o dict `permissoes` para `permissoes_mask`"""
+    migrados = 0
+    async for user in db.users.find({"permissoes": {"$exists": True}}, {"_id": 0, "id": 1, "permissoes": 1}):
+        await db.users.update_one(
+            {"id": user['id']},
+            {"$set": {"permissoes_mask": mascara_usuario(user)}, "$unset": {"permissoes": ""}}
+        )
+        migrados += 1
+    return migrados
+
+async def emitir_refresh_token(db, user_id: str) -> str:
+    """Cria refresh token opaco; só o hash SHA-256 fica no banco"""
+    token = secrets.token_urlsafe(48)
+    await db.refresh_tokens.insert_one({
+        "hash": _hash_refresh_token(token),
+        "user_id": user_id,
+        "revogado": False,
+        "expira_em": datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+        "created_at": datetime.utcnow().isoformat()
+    })
+    return token
+
+async def consumir_refresh_token(db, token: str) -> Optional[str]:
+    """
+    Valida e revoga o refresh token (rotação); retorna o user_id ou None
+    
+    - Reapresentado até REFRESH_TOKEN_GRACA_SEGUNDOS depois da rotação
+      (duas abas renovando juntas): aceito, e o chamador emite outro par
+    - Reuso fora dessa janela indica vazamento: todos os tokens do
+      usuário são revogados
+    """
+    agora = datetime.utcnow()
+    registro = await db.refresh_tokens.find_one_and_update(
+        {"hash": _hash_refresh_token(token)},
+        # $min: guarda o instante da primeira rotação
+        {"$set": {"revogado": True}, "$min": {"revogado_em": agora}},
+        projection={"_id": 0}
+    )
+    if not registro:
+        return None
+    
+    if registro['expira_em'] <= agora:
+        return None
+    
+    if registro.get('revogado'):
+        # Sem `revogado_em`: revogado por logout ou por reuso, nunca na rotação
+        revogado_em = registro.get('revogado_em')
+        if revogado_em and agora - revogado_em <= timedelta(seconds=REFRESH_TOKEN_GRACA_SEGUNDOS):
+            return registro['user_id']
+        await revogar_refresh_tokens(db, registro['user_id'])
+        return None
+    
+    return registro['user_id']
+
+async def revogar_refresh_token(db, token: str):
+    """Revoga um refresh token (logout)"""
+    await db.refresh_tokens.update_one(
+        {"hash": _hash_refresh_token(token)},
+        {"$set": {"revogado": True}, "$unset": {"revogado_em": ""}}
+    )
+
+async def revogar_refresh_tokens(db, user_id: str):
+    """Revoga todos os refresh tokens do usuário (inclusive a janela de graça dos já rotacionados)"""
+    await db.refresh_tokens.update_many(
+        {"user_id": user_id},
+        {"$set": {"revogado": True}, "$unset": {"revogado_em": ""}}
+    )
+
+def _hash_api_key(chave: str) -> str:
+    # HMAC com a SECRET_KEY: o digest vazado do banco não serve sem o segredo
+    return hmac.new(SECRET_KEY.encode(), chave.encode(), hashlib.sha256).hexdigest()
+
+async def criar_indices_api_keys(db):
+    """Índice do digest das API keys (uma busca por requisição)"""
+    await db.api_keys.create_index("hash", unique=True)
+    await db.api_keys.create_index("id", unique=True)
+
+async def emitir_api_key(db, nome: str, permissoes_mask: int, criado_por: str,
+                         expira_em_dias: Optional[int] = None) -> tuple:
+    """
+    Cria API key para integrações; retorna (registro, chave)
+    
+    A chave só é exibida aqui; no banco fica apenas o digest.
+    """
+    chave = "ibh_" + secrets.token_urlsafe(32)
+    registro = {
+        "id": str(uuid.uuid4()),
+        "nome": nome,
+        "prefixo": chave[:8],
+        "hash": _hash_api_key(chave),
+        "permissoes_mask": permissoes_mask,
+        "ativo": True,
+        "criado_por": criado_por,
+        "expira_em": datetime.utcnow() + timedelta(days=expira_em_dias) if expira_em_dias else None,
+        "created_at": datetime.utcnow().isoformat()
+    }
+    await db.api_keys.insert_one(registro.copy())
+    return registro, chave
+
+async def autenticar_api_key(db, chave: str) -> dict:
+    """
+    Valida a API key do header X-API-Key e retorna o usuário de serviço
+    
+    Uma busca pelo índice do digest e comparação em tempo constante; sem
+    bcrypt. O usuário retornado tem só as permissões da key.
+    """
+    digest = _hash_api_key(chave)
+    registro = await db.api_keys.find_one({"hash": digest}, {"_id": 0})
+    if (
+        registro is None
+        or not hmac.compare_digest(registro['hash'], digest)
+        or not registro.get('ativo', False)
+        or (registro.get('expira_em') and registro['expira_em'] <= datetime.utcnow())
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="API key inválida",
+        )
+    
+    return {
+        "id": f"api_key:{registro['id']}",
+        "nome": registro['nome'],
+        "role": None,
+        "ativo": True,
+        "permissoes_mask": registro['permissoes_mask'],
+        "api_key_id": registro['id']
+    }
+
 def decode_token(token: str):
-    """Decodifica token JWT"""
+    """
+    Decodifica token JWT
+    
+    O mesmo token chega em toda requisição da sessão; o payload verificado
+    fica em cache (chave = SHA-256 do token) até o `exp`, evitando refazer
+    o HMAC e o parse. Tokens inválidos não são cacheados.
+    """
+    chave = hashlib.sha256(token.encode()).digest()
+    payload = cache_tokens.obter(chave)
+    if payload is not None:
+        return payload
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
     except JWTError:
         return None
+    
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        restante = exp - time.time()
+        if restante > 0:
+            cache_tokens.definir(chave, payload, ttl=restante)
+    return payload
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db = None):
-    """Obtém usuário atual do token"""
+async def get_current_user(token: str = Depends(oauth2_scheme), db = None, completo: bool = False):
+    """
+    Obtém usuário atual do token
+    
+    - Access tokens com claims: usuário montado do próprio token, sem banco
+    - completo=True (ou tokens antigos sem claims): documento do usuário
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Não foi possível validar as credenciais",
@@ -58,15 +296,37 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db = None):
     if user_id is None:
         raise credentials_exception
     
-    # Buscar usuário no banco
+    if not completo and payload.get("typ") == "access" and "pm" in payload:
+        return {
+            "id": user_id,
+            "role": payload.get("role"),
+            "ativo": payload.get("at", False),
+            "permissoes_mask": payload["pm"]
+        }
+    
+    # Buscar usuário (cache por id, depois banco)
     if db is not None:
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
+        user = cache_usuarios.obter(user_id)
         if user is None:
-            raise credentials_exception
-        return user
+            user = await db.users.find_one({"id": user_id}, {"_id": 0, "senha_hash": 0})
+            if user is None:
+                raise credentials_exception
+            cache_usuarios.definir(user_id, user)
+        return user.copy()
     
     return {"id": user_id}
 
+def invalidar_usuario(user_id: Optional[str] = None):
+    """
+    Remove o usuário do cache após alteração, desativação ou exclusão
+    
+    Sem user_id (ex.: exclusão vista por change stream) limpa o cache todo.
+    """
+    if user_id is None:
+        cache_usuarios.limpar()
+    else:
+        cache_usuarios.invalidar(user_id)
+
 async def require_permission(permission: str, user: dict):
     """Verifica se usuário tem permissão específica"""
     if not user.get('ativo', False):
@@ -79,9 +339,8 @@ async def require_permission(permission: str, user: dict):
     if user.get('role') == 'Administrador':
         return True
     
-    # Verificar permissão específica
-    permissoes = user.get('permissoes', {})
-    if not permissoes.get(permission, False):
+    # Verificar permissão específica (máscara compilada)
+    if not tem_permissao(mascara_usuario(user), permission):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=f"Você não tem permissão para: {permission}"
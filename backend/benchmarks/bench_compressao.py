@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+IDEIABH - Benchmark: bytes e CPU por requisição com compressão
+
+Monta payloads parecidos com as respostas reais (esteira com todos os
+campos do contrato, kanban com `logs` embutidos) e passa cada um pelo
+CompressaoMiddleware, com gzip e brotli em vários níveis.
+
+Mostra tamanho original, tamanho comprimido, razão e tempo de CPU por
+requisição (média de N repetições).
+
+Uso: python benchmarks/bench_compressao.py [projetos] [repeticoes]
+"""
+
+import asyncio
+import json
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from compressao import CompressaoMiddleware, brotli
+
+
+def payload_esteira(projetos: int) -> bytes:
+    colunas = {"PRE_PRODUCAO": [], "PRODUCAO": [], "POS_PRODUCAO": []}
+    agora = datetime.utcnow()
+    for i in range(projetos):
+        colunas[list(colunas)[i % 3]].append({
+            "id": str(uuid.uuid4()),
+            "contrato_id": str(uuid.uuid4()),
+            "etapa_atual": "Criação (1ª e 2ª versão)",
+            "macro_etapa": "Criação",
+            "progresso": round(i * 0.7 % 100, 1),
+            "risco": "Baixo",
+            "data_entrega": (agora + timedelta(days=i)).isoformat(),
+            "created_at": agora.isoformat(),
+            "cliente": f"Cliente {i}",
+            "faculdade": "Faculdade de Ciências Aplicadas",
+            "numero_contrato": 1000 + i,
+            "valor": 25000.0 + i,
+            "logs": [
+                {"acao": "atualizar_projeto", "usuario": "Sistema", "timestamp": agora.isoformat(),
+                 "detalhes": {"etapa": "Criação", "progresso": i}}
+                for _ in range(5)
+            ]
+        })
+    return json.dumps({k: {"titulo": k, "cor": "#3b82f6", "projetos": v} for k, v in colunas.items()}).encode()
+
+
+def app_estatico(corpo: bytes):
+    async def app(scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(corpo)).encode())]
+        })
+        await send({"type": "http.response.body", "body": corpo})
+    return app
+
+
+async def medir(corpo: bytes, codificacao: str, nivel: int, repeticoes: int):
+    chave = "br" if codificacao == "br" else "gzip"
+    middleware = CompressaoMiddleware(
+        app_estatico(corpo),
+        tamanho_minimo=0,
+        nivel_gzip=nivel if chave == "gzip" else 0,
+        nivel_brotli=nivel if chave == "br" else 0
+    )
+    scope = {"type": "http", "path": "/api/projetos/esteira/visualizacao",
+             "headers": [(b"accept-encoding", codificacao.encode())]}
+
+    tamanho = 0
+    cpu = 0.0
+    for _ in range(repeticoes):
+        enviados = []
+
+        async def send(mensagem):
+            enviados.append(mensagem)
+
+        inicio = time.process_time()
+        await middleware(scope, None, send)
+        cpu += time.process_time() - inicio
+        tamanho = sum(len(m.get("body", b"")) for m in enviados)
+    return tamanho, cpu / repeticoes * 1000
+
+
+async def main():
+    projetos = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    repeticoes = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    corpo = payload_esteira(projetos)
+
+    print(f"Payload esteira: {projetos} projetos, {len(corpo) / 1024:.1f} KiB sem compressão\n")
+    print(f"{'codificação':<12} {'nível':>5} {'bytes':>10} {'razão':>7} {'CPU ms/req':>11}")
+
+    casos = [("gzip", n) for n in (1, 6, 9)]
+    if brotli is not None:
+        casos += [("br", n) for n in (1, 4, 6, 11)]
+    else:
+        print("(brotli não instalado: só gzip)")
+
+    for codificacao, nivel in casos:
+        tamanho, cpu_ms = await medir(corpo, codificacao, nivel, repeticoes)
+        print(f"{codificacao:<12} {nivel:>5} {tamanho:>10} {len(corpo) / tamanho:>6.1f}x {cpu_ms:>11.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
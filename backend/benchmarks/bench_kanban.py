@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+IDEIABH - Benchmark: montagem do Kanban com centenas de tarefas
+
+Compara a montagem anterior de `visualizar_kanban` (dict literal por
+requisição, cadeia de `EtapaProjeto.X.value in etapa` e preenchimento de
+campos padrão por tarefa) com `kanban.montar_kanban` (tabela etapa →
+coluna pré-calculada, uma consulta por tarefa).
+
+Uso: python benchmarks/bench_kanban.py [repeticoes]
+"""
+
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from models import EtapaProjeto, MacroEtapa, TarefaStatus
+from kanban import montar_kanban, COLUNAS_KANBAN
+
+
+def montar_kanban_anterior(tarefas):
+    """Cópia da implementação anterior, para comparação"""
+    kanban = {chave: {"titulo": titulo, "cor": cor, "tarefas": []} for chave, titulo, cor in COLUNAS_KANBAN}
+    for tarefa in tarefas:
+        if 'macro_etapa' not in tarefa:
+            tarefa['macro_etapa'] = MacroEtapa.ATENDIMENTO.value
+        if 'numero' not in tarefa:
+            tarefa['numero'] = 0
+        if 'atividade' not in tarefa:
+            tarefa['atividade'] = tarefa.get('titulo', 'Atividade')
+        if 'setor' not in tarefa:
+            tarefa['setor'] = 'Geral'
+
+        etapa = tarefa.get('etapa', '')
+        if EtapaProjeto.LANCAMENTO.value in etapa:
+            kanban["LANCAMENTO"]["tarefas"].append(tarefa)
+        elif EtapaProjeto.ATIVACAO.value in etapa:
+            kanban["ATIVACAO"]["tarefas"].append(tarefa)
+        elif EtapaProjeto.REVISAO_TEXTO.value in etapa:
+            kanban["REVISAO"]["tarefas"].append(tarefa)
+        elif EtapaProjeto.CRIACAO_1_2.value in etapa or EtapaProjeto.CONFERENCIA.value in etapa or EtapaProjeto.AJUSTE_LAYOUT.value in etapa:
+            kanban["CRIACAO_1_2"]["tarefas"].append(tarefa)
+        elif EtapaProjeto.CRIACAO_3_4.value in etapa:
+            kanban["CRIACAO_3_4"]["tarefas"].append(tarefa)
+        elif EtapaProjeto.APROVACAO_FINAL.value in etapa:
+            kanban["APROVACAO"]["tarefas"].append(tarefa)
+        elif EtapaProjeto.PLANEJAMENTO_PRODUCAO.value in etapa:
+            kanban["PLANEJAMENTO"]["tarefas"].append(tarefa)
+        elif EtapaProjeto.PRE_PRODUCAO.value in etapa:
+            kanban["PRE_PRODUCAO"]["tarefas"].append(tarefa)
+        elif etapa in [EtapaProjeto.PRODUCAO.value, EtapaProjeto.QUALIDADE.value, EtapaProjeto.ENTREGA.value]:
+            if tarefa.get('status') == TarefaStatus.CONCLUIDO.value:
+                kanban["CONCLUIDO"]["tarefas"].append(tarefa)
+            else:
+                kanban["PRODUCAO"]["tarefas"].append(tarefa)
+        else:
+            if tarefa.get('status') == TarefaStatus.CONCLUIDO.value:
+                kanban["CONCLUIDO"]["tarefas"].append(tarefa)
+            else:
+                kanban["LANCAMENTO"]["tarefas"].append(tarefa)
+    return kanban
+
+
+def gerar_tarefas(quantidade: int):
+    etapas = [e.value for e in EtapaProjeto]
+    status = [s.value for s in TarefaStatus]
+    return [
+        {
+            "id": str(i),
+            "etapa": random.choice(etapas),
+            "status": random.choice(status),
+            "macro_etapa": MacroEtapa.CRIACAO.value,
+            "numero": i,
+            "atividade": f"Atividade {i}",
+            "setor": "Criação",
+            "titulo": f"Tarefa {i}",
+        }
+        for i in range(quantidade)
+    ]
+
+
+def medir(funcao, tarefas, repeticoes: int) -> float:
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao(tarefas)
+    return (time.perf_counter() - inicio) / repeticoes * 1_000_000
+
+
+def main():
+    repeticoes = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    random.seed(42)
+
+    print(f"{'tarefas':>8} {'anterior µs':>12} {'tabela µs':>10} {'ganho':>7}")
+    for quantidade in (50, 200, 500, 1000):
+        tarefas = gerar_tarefas(quantidade)
+
+        # As duas versões precisam colocar cada tarefa na mesma coluna
+        anterior = montar_kanban_anterior([dict(t) for t in tarefas])
+        novo = montar_kanban([dict(t) for t in tarefas])
+        assert {k: [t['id'] for t in v['tarefas']] for k, v in anterior.items()} == \
+               {k: [t['id'] for t in v['tarefas']] for k, v in novo.items()}
+
+        t_anterior = medir(montar_kanban_anterior, tarefas, repeticoes)
+        t_novo = medir(montar_kanban, tarefas, repeticoes)
+        print(f"{quantidade:>8} {t_anterior:>12.1f} {t_novo:>10.1f} {t_anterior / t_novo:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
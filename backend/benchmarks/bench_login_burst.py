@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+IDEIABH - Benchmark: latência de endpoints não relacionados durante rajada de logins
+
+Simula no mesmo event loop:
+- uma rajada de logins (verificação bcrypt)
+- requisições leves e frequentes (ex.: polling de notificações)
+
+Compara bcrypt inline no handler (bloqueando o loop) com bcrypt no pool
+`senha_executor` e mostra p50/p99 das requisições leves.
+
+Uso: python benchmarks/bench_login_burst.py [logins] [concorrencia]
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from auth import hash_password, verify_password, verify_password_async, SENHA_WORKERS
+
+SENHA = "senha-de-teste-123"
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    idx = min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))
+    return valores[idx]
+
+
+async def requisicao_leve():
+    """Handler barato que só precisa do event loop livre"""
+    await asyncio.sleep(0)
+
+
+async def cliente_leve(latencias, parar: asyncio.Event):
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        await requisicao_leve()
+        latencias.append((time.perf_counter() - inicio) * 1000)
+        await asyncio.sleep(0.005)
+
+
+async def login_inline(senha_hash):
+    return verify_password(SENHA, senha_hash)
+
+
+async def login_executor(senha_hash):
+    return await verify_password_async(SENHA, senha_hash)
+
+
+async def rodar(nome, login, senha_hash, logins, concorrencia):
+    latencias = []
+    parar = asyncio.Event()
+    clientes = [asyncio.create_task(cliente_leve(latencias, parar)) for _ in range(20)]
+
+    semaforo = asyncio.Semaphore(concorrencia)
+
+    async def um_login():
+        async with semaforo:
+            await login(senha_hash)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(um_login() for _ in range(logins)))
+    duracao = time.perf_counter() - inicio
+
+    parar.set()
+    await asyncio.gather(*clientes)
+
+    print(f"{nome:<10} logins={logins} em {duracao:.2f}s | "
+          f"requisições leves={len(latencias)} "
+          f"p50={statistics.median(latencias):.2f}ms "
+          f"p99={percentil(latencias, 99):.2f}ms "
+          f"max={max(latencias):.2f}ms")
+
+
+async def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    concorrencia = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    senha_hash = hash_password(SENHA)
+
+    print(f"Pool bcrypt: {SENHA_WORKERS} thread(s)")
+    await rodar("inline", login_inline, senha_hash, logins, concorrencia)
+    await rodar("executor", login_executor, senha_hash, logins, concorrencia)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
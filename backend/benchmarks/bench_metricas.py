@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+IDEIABH - Benchmark: custo do MetricasMiddleware por requisição
+
+Chama uma aplicação ASGI mínima (resposta JSON pronta, rota já casada em
+`scope["route"]`, como o roteador do FastAPI deixa) com e sem o
+middleware, espalhando as requisições por ~40 rotas e alguns status, e
+mostra o acréscimo em µs por requisição e o tempo para exportar /metrics.
+
+Uso: python benchmarks/bench_metricas.py [requisicoes]
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from metricas import MetricasMiddleware, registro
+
+CORPO = b'{"total": 3, "itens": [1, 2, 3]}'
+ROTAS = [SimpleNamespace(path=f"/api/recurso{i}/{{item_id}}") for i in range(40)]
+STATUS = (200, 200, 200, 200, 201, 304, 404, 500)
+
+
+async def app_minima(scope, receive, send):
+    scope["route"] = ROTAS[scope["indice"] % len(ROTAS)]
+    await send({
+        "type": "http.response.start",
+        "status": STATUS[scope["indice"] % len(STATUS)],
+        "headers": [(b"content-type", b"application/json")]
+    })
+    await send({"type": "http.response.body", "body": CORPO})
+
+
+async def enviar(mensagem):
+    pass
+
+
+async def medir(app, requisicoes: int) -> float:
+    inicio = time.perf_counter()
+    for i in range(requisicoes):
+        await app({"type": "http", "method": "GET", "path": "/api/recurso", "indice": i}, None, enviar)
+    return (time.perf_counter() - inicio) / requisicoes * 1_000_000
+
+
+async def main():
+    requisicoes = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    com_metricas = MetricasMiddleware(app_minima)
+
+    # Aquecimento: cria as séries antes de medir
+    await medir(com_metricas, 1000)
+
+    sem = await medir(app_minima, requisicoes)
+    com = await medir(com_metricas, requisicoes)
+    print(f"{requisicoes} requisições, {len(ROTAS)} rotas")
+    print(f"sem middleware: {sem:8.2f} µs/req")
+    print(f"com middleware: {com:8.2f} µs/req")
+    print(f"acréscimo:      {com - sem:8.2f} µs/req")
+
+    inicio = time.perf_counter()
+    texto = registro.exportar()
+    print(f"\nexportar /metrics: {(time.perf_counter() - inicio) * 1000:.2f} ms, "
+          f"{texto.count(chr(10))} linhas, {len(texto) / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
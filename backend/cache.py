@@ -0,0 +1,73 @@
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CacheTTL:
+    """
+    Cache em memória com expiração (TTL) e tamanho máximo (LRU)
+
+    Usado para dados lidos em toda requisição e que podem ficar alguns
+    segundos desatualizados. Escritas devem invalidar explicitamente.
+    """
+
+    def __init__(self, nome: str, ttl: float, tamanho_maximo: int = 1000):
+        self.nome = nome
+        self.ttl = ttl
+        self.tamanho_maximo = tamanho_maximo
+        self.itens: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidacoes = 0
+
+    def obter(self, chave: Hashable) -> Optional[Any]:
+        """Retorna o valor ou None se ausente/expirado"""
+        item = self.itens.get(chave)
+        if item is None:
+            self.misses += 1
+            return None
+
+        valor, expira_em = item
+        if expira_em <= time.monotonic():
+            del self.itens[chave]
+            self.misses += 1
+            return None
+
+        self.itens.move_to_end(chave)
+        self.hits += 1
+        return valor
+
+    def definir(self, chave: Hashable, valor: Any, ttl: Optional[float] = None):
+        """Grava o valor; remove o menos usado se passar do tamanho máximo"""
+        if self.tamanho_maximo <= 0:
+            return
+        self.itens[chave] = (valor, time.monotonic() + (self.ttl if ttl is None else ttl))
+        self.itens.move_to_end(chave)
+        while len(self.itens) > self.tamanho_maximo:
+            self.itens.popitem(last=False)
+
+    def invalidar(self, chave: Hashable):
+        """Remove uma chave"""
+        if self.itens.pop(chave, None) is not None:
+            self.invalidacoes += 1
+
+    def limpar(self):
+        """Remove todas as chaves"""
+        self.invalidacoes += len(self.itens)
+        self.itens.clear()
+
+    def estatisticas(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "nome": self.nome,
+            "itens": len(self.itens),
+            "tamanho_maximo": self.tamanho_maximo,
+            "ttl_segundos": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidacoes": self.invalidacoes,
+            "taxa_acerto": round(self.hits / total, 4) if total else 0.0
+        }
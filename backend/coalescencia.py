@@ -0,0 +1,76 @@
+from functools import wraps
+from typing import Dict, Hashable
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Todos os coalescedores criados, para o endpoint de métricas
+COALESCEDORES: Dict[str, "Coalescedor"] = {}
+
+
+class Coalescedor:
+    """
+    Single-flight: chamadas concorrentes iguais compartilham uma execução
+
+    Enquanto uma execução com os mesmos argumentos está em andamento, as
+    novas chamadas aguardam o mesmo resultado (ou a mesma exceção) em vez
+    de repetir as consultas. Terminada a execução, a próxima chamada roda
+    de novo: não é cache.
+
+    A execução roda numa task separada; se o cliente que a iniciou
+    desconectar, as demais continuam aguardando normalmente.
+    """
+
+    def __init__(self, nome: str):
+        self.nome = nome
+        self.em_voo: Dict[Hashable, asyncio.Future] = {}
+        self.execucoes = 0
+        self.coalescidas = 0
+
+    def __call__(self, funcao):
+        @wraps(funcao)
+        async def wrapper(*args, **kwargs):
+            chave = (args, tuple(sorted(kwargs.items())))
+            try:
+                tarefa = self.em_voo.get(chave)
+            except TypeError:  # argumentos não-hashable: executa direto
+                return await funcao(*args, **kwargs)
+
+            if tarefa is None:
+                tarefa = asyncio.ensure_future(funcao(*args, **kwargs))
+                self.em_voo[chave] = tarefa
+                tarefa.add_done_callback(lambda t: self._finalizar(chave, t))
+                self.execucoes += 1
+            else:
+                self.coalescidas += 1
+            return await asyncio.shield(tarefa)
+        return wrapper
+
+    def _finalizar(self, chave: Hashable, tarefa: asyncio.Future):
+        self.em_voo.pop(chave, None)
+        # Marca a exceção como lida mesmo se todos os chamadores desistiram
+        if not tarefa.cancelled():
+            tarefa.exception()
+
+    def estatisticas(self) -> dict:
+        total = self.execucoes + self.coalescidas
+        return {
+            "nome": self.nome,
+            "em_voo": len(self.em_voo),
+            "execucoes": self.execucoes,
+            "coalescidas": self.coalescidas,
+            "taxa_coalescencia": round(self.coalescidas / total, 4) if total else 0.0
+        }
+
+
+def coalescer(nome: str) -> Coalescedor:
+    """
+    Decorator de single-flight para leituras caras
+
+        @coalescer("dashboard")
+        async def obter_dashboard(): ...
+    """
+    coalescedor = Coalescedor(nome)
+    COALESCEDORES[nome] = coalescedor
+    return coalescedor
@@ -0,0 +1,215 @@
+from typing import Dict, Optional, Tuple
+import os
+import zlib
+import logging
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional; sem ele só gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSAO_TAMANHO_MINIMO = int(os.getenv("COMPRESSAO_TAMANHO_MINIMO", "1024"))
+COMPRESSAO_NIVEL_GZIP = int(os.getenv("COMPRESSAO_NIVEL_GZIP", "6"))
+COMPRESSAO_NIVEL_BROTLI = int(os.getenv("COMPRESSAO_NIVEL_BROTLI", "4"))
+
+# Só vale a pena comprimir texto
+TIPOS_COMPRESSIVEIS = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+def codificacoes_aceitas(accept_encoding: str) -> Dict[str, float]:
+    """
+    Accept-Encoding → {codificação: q}
+
+    `br;q=0` é recusa explícita (q=0); q inválido conta como recusa.
+    """
+    aceitas = {}
+    for parte in accept_encoding.split(","):
+        token, *parametros = [p.strip() for p in parte.split(";")]
+        if not token:
+            continue
+        q = 1.0
+        for parametro in parametros:
+            nome, _, valor = parametro.partition("=")
+            if nome.strip().lower() == "q":
+                try:
+                    q = float(valor)
+                except ValueError:
+                    q = 0.0
+        aceitas[token.lower()] = q
+    return aceitas
+
+
+def _com_vary(mensagem):
+    """Acrescenta Accept-Encoding ao Vary da resposta (sem duplicar)"""
+    headers = []
+    vary = None
+    for nome, valor in mensagem.get("headers", []):
+        if nome.lower() == b"vary":
+            vary = valor if vary is None else vary + b", " + valor
+        else:
+            headers.append((nome, valor))
+    if vary is None:
+        vary = b"Accept-Encoding"
+    elif b"accept-encoding" not in vary.lower() and vary.strip() != b"*":
+        vary += b", Accept-Encoding"
+    headers.append((b"vary", vary))
+    return {**mensagem, "headers": headers}
+
+
+class _Compressor:
+    """Interface comum para gzip e brotli em modo streaming"""
+
+    def __init__(self, codificacao: str, nivel: int):
+        self.codificacao = codificacao
+        if codificacao == "br":
+            self._br = brotli.Compressor(quality=nivel)
+        else:
+            self._gz = zlib.compressobj(nivel, zlib.DEFLATED, 31)  # 31 = cabeçalho gzip
+
+    def comprimir(self, dados: bytes) -> bytes:
+        """Comprime um pedaço e descarrega o que já puder ir para o cliente"""
+        if self.codificacao == "br":
+            return self._br.process(dados) + self._br.flush()
+        return self._gz.compress(dados) + self._gz.flush(zlib.Z_SYNC_FLUSH)
+
+    def finalizar(self, dados: bytes = b"") -> bytes:
+        if self.codificacao == "br":
+            return self._br.process(dados) + self._br.finish()
+        return self._gz.compress(dados) + self._gz.flush()
+
+
+class CompressaoMiddleware:
+    """
+    Compressão gzip/brotli das respostas (middleware ASGI)
+
+    - Escolhe pela q do Accept-Encoding (q=0 recusa), brotli no empate se o
+      pacote estiver instalado, senão gzip
+    - `Vary: Accept-Encoding` em toda resposta compressível
+    - Respostas completas menores que `tamanho_minimo` vão sem compressão
+    - Respostas em streaming (StreamingResponse) são comprimidas pedaço a
+      pedaço, sem acumular o corpo
+    - `niveis_por_rota` ajusta os níveis por prefixo de caminho, ex.:
+      {"/api/projetos/esteira": {"gzip": 9, "br": 6}}; nível 0 desliga
+    """
+
+    def __init__(
+        self,
+        app,
+        tamanho_minimo: int = COMPRESSAO_TAMANHO_MINIMO,
+        nivel_gzip: int = COMPRESSAO_NIVEL_GZIP,
+        nivel_brotli: int = COMPRESSAO_NIVEL_BROTLI,
+        niveis_por_rota: Optional[Dict[str, Dict[str, int]]] = None
+    ):
+        self.app = app
+        self.tamanho_minimo = tamanho_minimo
+        self.niveis_padrao = {"gzip": nivel_gzip, "br": nivel_brotli}
+        # Prefixos mais longos primeiro
+        self.niveis_por_rota = sorted((niveis_por_rota or {}).items(), key=lambda item: -len(item[0]))
+
+    def _escolher(self, scope) -> Optional[Tuple[str, int]]:
+        """Codificação e nível para a requisição, ou None para não comprimir"""
+        aceitas: Dict[str, float] = {}
+        for nome, valor in scope.get("headers", []):
+            if nome == b"accept-encoding":
+                aceitas = codificacoes_aceitas(valor.decode("latin-1"))
+                break
+        if not aceitas:
+            return None
+
+        niveis = self.niveis_padrao
+        caminho = scope.get("path", "")
+        for prefixo, niveis_rota in self.niveis_por_rota:
+            if caminho.startswith(prefixo):
+                niveis = {**self.niveis_padrao, **niveis_rota}
+                break
+
+        curinga = aceitas.get("*", 0.0)
+        candidatas = []
+        for codificacao in ("br", "gzip"):  # empate no q: brotli primeiro
+            if codificacao == "br" and brotli is None:
+                continue
+            q = aceitas.get(codificacao, curinga)
+            if q > 0 and niveis.get(codificacao, 0) > 0:
+                candidatas.append((q, codificacao))
+        if not candidatas:
+            return None
+        _, codificacao = max(candidatas, key=lambda item: item[0])
+        return codificacao, niveis[codificacao]
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        escolha = self._escolher(scope)
+        codificacao, nivel = escolha or (None, 0)
+        inicio_resposta = None
+        compressor: Optional[_Compressor] = None
+        repassar = False
+
+        async def enviar(mensagem):
+            nonlocal inicio_resposta, compressor, repassar
+
+            if mensagem["type"] == "http.response.start":
+                headers = {nome.lower(): valor for nome, valor in mensagem.get("headers", [])}
+                tipo = headers.get(b"content-type", b"").decode("latin-1")
+                compressivel = tipo.startswith(TIPOS_COMPRESSIVEIS)
+                # Vary em toda resposta compressível, comprimida ou não: um cache
+                # compartilhado não pode servir o corpo sem compressão a quem aceita
+                if compressivel:
+                    mensagem = _com_vary(mensagem)
+                inicio_resposta = mensagem
+                repassar = escolha is None or b"content-encoding" in headers or not compressivel
+                if repassar:
+                    await send(mensagem)
+                return
+
+            if mensagem["type"] != "http.response.body" or repassar:
+                await send(mensagem)
+                return
+
+            corpo = mensagem.get("body", b"")
+            mais = mensagem.get("more_body", False)
+
+            if compressor is None:
+                if not mais:
+                    # Resposta completa: só comprime se compensar
+                    if len(corpo) < self.tamanho_minimo:
+                        await send(inicio_resposta)
+                        await send(mensagem)
+                        return
+                    dados = _Compressor(codificacao, nivel).finalizar(corpo)
+                    await send(self._inicio_comprimido(inicio_resposta, codificacao, len(dados)))
+                    await send({"type": "http.response.body", "body": dados})
+                    return
+
+                # Streaming: tamanho final desconhecido, comprime por pedaço
+                compressor = _Compressor(codificacao, nivel)
+                await send(self._inicio_comprimido(inicio_resposta, codificacao, None))
+
+            if mais:
+                dados = compressor.comprimir(corpo)
+                if dados:
+                    await send({"type": "http.response.body", "body": dados, "more_body": True})
+            else:
+                await send({"type": "http.response.body", "body": compressor.finalizar(corpo)})
+
+        await self.app(scope, receive, enviar)
+
+    def _inicio_comprimido(self, mensagem, codificacao: str, tamanho: Optional[int]):
+        headers = []
+        for nome, valor in mensagem.get("headers", []):
+            nome_minusculo = nome.lower()
+            if nome_minusculo == b"content-length":
+                continue
+            # Outra representação do mesmo recurso: ETag forte vira fraca (como o nginx);
+            # If-None-Match usa comparação fraca, então o 304 continua funcionando
+            if nome_minusculo == b"etag" and not valor.startswith(b"W/"):
+                valor = b"W/" + valor
+            headers.append((nome, valor))
+        headers.append((b"content-encoding", codificacao.encode()))
+        if tamanho is not None:
+            headers.append((b"content-length", str(tamanho).encode()))
+        return {**mensagem, "headers": headers}
@@ -1,9 +1,11 @@
-from typing import List
+from typing import List, Optional, Tuple
 from datetime import datetime, timedelta
 from models import (
     Tarefa, EtapaProjeto, MacroEtapa, TarefaStatus,
     NotificacaoUsuario, ESTEIRA_COMPLETA
 )
+from notificacoes import ContadorNotificacoes, DigestNotificacoes
+from versoes import carimbo_alteracao
 import logging
 
 logger = logging.getLogger(__name__)
@@ -55,6 +57,7 @@ class GeradorTarefas:
             tarefa_dict['status'] = tarefa_dict['status'].value
             tarefa_dict['prazo'] = tarefa_dict['prazo'].isoformat()
             tarefa_dict['created_at'] = tarefa_dict['created_at'].isoformat()
+            tarefa_dict.update(await carimbo_alteracao(self.db))
             
             await self.db.tarefas.insert_one(tarefa_dict)
             tarefas_criadas.append(tarefa)
@@ -106,6 +109,8 @@ class GeradorNotificacoes:
     
     def __init__(self, db):
         self.db = db
+        self.contador = ContadorNotificacoes(db)
+        self.digest = DigestNotificacoes(db, self.contador)
     
     async def notificar_tarefa_atribuida(self, tarefa: Tarefa):
         """Notifica quando uma tarefa é atribuída"""
@@ -123,15 +128,13 @@ class GeradorNotificacoes:
             link=f"/tarefas?tarefa_id={tarefa.id}"
         )
         
-        notif_dict = notificacao.dict()
-        notif_dict['created_at'] = notif_dict['created_at'].isoformat()
-        
-        await self.db.notificacoes_usuarios.insert_one(notif_dict)
+        await self.digest.adicionar(notificacao)
         logger.info(f"Notificação criada para {tarefa.responsavel}")
     
-    async def notificar_tarefa_atrasada(self, tarefa: Tarefa, dias_atraso: int):
+    async def notificar_tarefa_atrasada(self, tarefa: Tarefa, dias_atraso: int, user: Optional[dict] = None):
         """Notifica quando uma tarefa está atrasada"""
-        user = await self.db.users.find_one({"nome": tarefa.responsavel})
+        if user is None:
+            user = await self.db.users.find_one({"nome": tarefa.responsavel})
         
         if not user:
             return
@@ -144,12 +147,44 @@ class GeradorNotificacoes:
             link=f"/tarefas?tarefa_id={tarefa.id}"
         )
         
-        notif_dict = notificacao.dict()
-        notif_dict['created_at'] = notif_dict['created_at'].isoformat()
-        
-        await self.db.notificacoes_usuarios.insert_one(notif_dict)
+        await self.digest.adicionar(notificacao)
         logger.info(f"Notificação de atraso enviada para {tarefa.responsavel}")
     
+    async def notificar_tarefas_atrasadas(self, atrasadas: List[Tuple[Tarefa, int]]) -> int:
+        """Notifica um lote de tarefas atrasadas com uma única busca de usuários"""
+        nomes = list({tarefa.responsavel for tarefa, _ in atrasadas})
+        users = await self.db.users.find({"nome": {"$in": nomes}}, {"_id": 0, "id": 1, "nome": 1}).to_list(len(nomes) or 1)
+        users_por_nome = {u['nome']: u for u in users}
+        
+        enviadas = 0
+        for tarefa, dias_atraso in atrasadas:
+            user = users_por_nome.get(tarefa.responsavel)
+            if user:
+                await self.notificar_tarefa_atrasada(tarefa, dias_atraso, user)
+                enviadas += 1
+        return enviadas
+    
+    async def notificar_destinatario(self, destinatario: str, tipo: str, titulo: str, mensagem: str, link: Optional[str] = None) -> bool:
+        """Entrega na caixa de entrada do usuário identificado por nome ou e-mail"""
+        user = await self.db.users.find_one(
+            {"$or": [{"nome": destinatario}, {"email": destinatario}]},
+            {"_id": 0, "id": 1}
+        )
+        
+        if not user:
+            return False
+        
+        notificacao = NotificacaoUsuario(
+            user_id=user['id'],
+            tipo=tipo,
+            titulo=titulo,
+            mensagem=mensagem,
+            link=link
+        )
+        
+        await self.digest.adicionar(notificacao)
+        return True
+    
     async def notificar_aprovacao_necessaria(self, projeto_id: str, etapa: str):
         """Notifica quando uma aprovação é necessária"""
         # Notificar todos os administradores
@@ -164,10 +199,7 @@ class GeradorNotificacoes:
                 link=f"/projetos?projeto_id={projeto_id}"
             )
             
-            notif_dict = notificacao.dict()
-            notif_dict['created_at'] = notif_dict['created_at'].isoformat()
-            
-            await self.db.notificacoes_usuarios.insert_one(notif_dict)
+            await self.digest.adicionar(notificacao)
 
 
 class CalculadorCriticidade:
@@ -0,0 +1,200 @@
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+from pymongo import monitoring
+from metricas import registro, Histograma, Contador, rota_da_requisicao
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+MONGO_INSTRUMENTACAO_ATIVA = os.getenv("MONGO_INSTRUMENTACAO_ATIVA", "1") == "1"
+# Acima disso, a mesma forma de consulta numa requisição gera aviso de N+1
+CONSULTAS_REPETIDAS_LIMITE = int(os.getenv("CONSULTAS_REPETIDAS_LIMITE", "10"))
+
+# Comandos que não são consultas da aplicação
+COMANDOS_IGNORADOS = frozenset({
+    "hello", "ismaster", "isMaster", "ping", "buildInfo", "endSessions",
+    "saslStart", "saslContinue", "authenticate", "killCursors",
+})
+
+consultas_por_requisicao = registro.registrar(Histograma(
+    "mongo_consultas_por_requisicao", "Comandos Mongo executados por requisição",
+    ("rota",), (1, 2, 5, 10, 20, 50, 100, 200, 500)
+))
+tempo_mongo_por_requisicao = registro.registrar(Histograma(
+    "mongo_tempo_por_requisicao_segundos", "Tempo somado dos comandos Mongo por requisição",
+    ("rota",)
+))
+consultas_repetidas = registro.registrar(Contador(
+    "mongo_consultas_repetidas_total", "Requisições com a mesma forma de consulta repetida acima do limite (N+1)",
+    ("rota",)
+))
+
+
+def _forma(valor):
+    """Estrutura de um filtro sem os valores: {"id": "abc"} e {"id": "xyz"} têm a mesma forma"""
+    if isinstance(valor, dict):
+        return "{" + ",".join(f"{chave}:{_forma(v)}" for chave, v in sorted(valor.items())) + "}"
+    if isinstance(valor, (list, tuple)):
+        return "[" + (_forma(valor[0]) if valor and isinstance(valor[0], dict) else "") + "]"
+    return "?"
+
+
+def forma_consulta(comando_nome: str, comando: dict) -> Tuple[str, str]:
+    """(coleção, forma) de um comando: nome + coleção + estrutura do filtro"""
+    if comando_nome == "getMore":
+        colecao = comando.get("collection", "")
+    else:
+        colecao = comando.get(comando_nome, "")
+        if not isinstance(colecao, str):
+            colecao = ""
+
+    if comando_nome in ("find", "count", "distinct", "findAndModify"):
+        filtro = comando.get("filter", comando.get("query"))
+    elif comando_nome == "aggregate":
+        pipeline = comando.get("pipeline") or [{}]
+        filtro = pipeline[0].get("$match")
+    elif comando_nome in ("update", "delete"):
+        operacoes = comando.get("updates") or comando.get("deletes") or [{}]
+        filtro = operacoes[0].get("q")
+    else:
+        filtro = None
+
+    forma = f"{comando_nome} {colecao}"
+    if filtro:
+        forma += f" {_forma(filtro)}"
+    return colecao, forma
+
+
+class ConsultasRequisicao:
+    """
+    Comandos Mongo de uma requisição
+
+    Os eventos chegam das threads do executor do Motor (que copia o
+    contexto da requisição), possivelmente várias ao mesmo tempo com
+    `asyncio.gather`; por isso o lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.quantidade = 0
+        self.tempo_total = 0.0
+        self.mais_lenta: Optional[Tuple[str, float]] = None
+        self.formas: Dict[str, int] = {}
+        self.em_andamento: Dict[int, str] = {}
+
+    def iniciado(self, request_id: int, forma: str, repete: bool):
+        with self.lock:
+            self.em_andamento[request_id] = forma
+            self.quantidade += 1
+            # getMore continua o mesmo cursor: conta como comando, não como repetição
+            if repete:
+                self.formas[forma] = self.formas.get(forma, 0) + 1
+
+    def finalizado(self, request_id: int, duracao: float):
+        with self.lock:
+            forma = self.em_andamento.pop(request_id, None)
+            if forma is None:
+                return
+            self.tempo_total += duracao
+            if self.mais_lenta is None or duracao > self.mais_lenta[1]:
+                self.mais_lenta = (forma, duracao)
+
+    def repetidas(self, limite: int) -> Dict[str, int]:
+        return {forma: n for forma, n in self.formas.items() if n > limite}
+
+    def server_timing(self) -> str:
+        """Valor do header Server-Timing (durações em ms)"""
+        metricas = [f'db;dur={self.tempo_total * 1000:.1f};desc="{self.quantidade} comandos"']
+        if self.mais_lenta is not None:
+            forma, duracao = self.mais_lenta
+            resumo = " ".join(forma.split(" ")[:2]).replace('"', "")
+            metricas.append(f'db-lenta;dur={duracao * 1000:.1f};desc="{resumo}"')
+        return ", ".join(metricas)
+
+
+_consultas: ContextVar[Optional[ConsultasRequisicao]] = ContextVar("consultas_mongo", default=None)
+
+
+def consultas_atuais() -> Optional[ConsultasRequisicao]:
+    """Contador de comandos da requisição em andamento, ou None fora de requisições"""
+    return _consultas.get()
+
+
+class OuvinteComandosMongo(monitoring.CommandListener):
+    """
+    CommandListener do pymongo que atribui cada comando à requisição atual
+
+    Comandos fora de uma requisição (tarefas periódicas, change streams)
+    são ignorados.
+    """
+
+    def started(self, event):
+        consultas = _consultas.get()
+        if consultas is None or event.command_name in COMANDOS_IGNORADOS:
+            return
+        _, forma = forma_consulta(event.command_name, event.command)
+        consultas.iniciado(event.request_id, forma, event.command_name != "getMore")
+
+    def succeeded(self, event):
+        consultas = _consultas.get()
+        if consultas is not None:
+            consultas.finalizado(event.request_id, event.duration_micros / 1_000_000)
+
+    def failed(self, event):
+        self.succeeded(event)
+
+
+ouvinte_comandos = OuvinteComandosMongo()
+
+
+class InstrumentacaoMongoMiddleware:
+    """
+    Consultas Mongo por requisição: Server-Timing, métricas e aviso de N+1 (ASGI)
+
+    - Abre um `ConsultasRequisicao` no contexto da requisição
+    - Acrescenta `Server-Timing: db;dur=..., db-lenta;dur=...` à resposta
+      (visível na aba Network do navegador)
+    - Ao final, alimenta os histogramas por rota e avisa no log quando a
+      mesma forma de consulta se repete mais de `limite` vezes
+    """
+
+    def __init__(self, app, limite: int = CONSULTAS_REPETIDAS_LIMITE):
+        self.app = app
+        self.limite = limite
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        consultas = ConsultasRequisicao()
+        token = _consultas.set(consultas)
+
+        async def enviar(mensagem):
+            if mensagem["type"] == "http.response.start":
+                headers = list(mensagem.get("headers", []))
+                headers.append((b"server-timing", consultas.server_timing().encode("latin-1", "replace")))
+                mensagem = {**mensagem, "headers": headers}
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _consultas.reset(token)
+            self._registrar(scope, consultas)
+
+    def _registrar(self, scope, consultas: ConsultasRequisicao):
+        rota = rota_da_requisicao(scope)
+        consultas_por_requisicao.observar((rota,), consultas.quantidade)
+        tempo_mongo_por_requisicao.observar((rota,), consultas.tempo_total)
+
+        repetidas = consultas.repetidas(self.limite)
+        if repetidas:
+            consultas_repetidas.incrementar((rota,))
+            for forma, vezes in sorted(repetidas.items(), key=lambda item: -item[1]):
+                logger.warning(
+                    f"Possível N+1 em {scope.get('method')} {rota}: '{forma}' executada {vezes} vezes "
+                    f"({consultas.quantidade} comandos, {consultas.tempo_total * 1000:.1f} ms no Mongo)"
+                )
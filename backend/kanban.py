@@ -0,0 +1,82 @@
+from typing import Dict, List, Tuple
+from models import EtapaProjeto, MacroEtapa, TarefaStatus
+from versoes import carimbo_alteracao, liberar_reservas
+
+# Colunas do Kanban na ordem de exibição: (chave, título, cor)
+COLUNAS_KANBAN: List[Tuple[str, str, str]] = [
+    ("LANCAMENTO", "Lançamento", "#6366f1"),
+    ("ATIVACAO", "Ativação", "#8b5cf6"),
+    ("REVISAO", "Revisão/Preparação", "#ec4899"),
+    ("CRIACAO_1_2", "Criação (1ª/2ª)", "#f59e0b"),
+    ("CRIACAO_3_4", "Criação (3ª/4ª)", "#f97316"),
+    ("APROVACAO", "Aprovação Final", "#10b981"),
+    ("PLANEJAMENTO", "Planejamento", "#3b82f6"),
+    ("PRE_PRODUCAO", "Pré-Produção", "#06b6d4"),
+    ("PRODUCAO", "Produção", "#14b8a6"),
+    ("CONCLUIDO", "Concluído", "#22c55e"),
+]
+
+# Etapa → (coluna da tarefa em aberto, coluna da tarefa concluída)
+COLUNA_POR_ETAPA: Dict[str, Tuple[str, str]] = {
+    EtapaProjeto.LANCAMENTO.value: ("LANCAMENTO", "LANCAMENTO"),
+    EtapaProjeto.ATIVACAO.value: ("ATIVACAO", "ATIVACAO"),
+    EtapaProjeto.REVISAO_TEXTO.value: ("REVISAO", "REVISAO"),
+    EtapaProjeto.CRIACAO_1_2.value: ("CRIACAO_1_2", "CRIACAO_1_2"),
+    EtapaProjeto.CONFERENCIA.value: ("CRIACAO_1_2", "CRIACAO_1_2"),
+    EtapaProjeto.AJUSTE_LAYOUT.value: ("CRIACAO_1_2", "CRIACAO_1_2"),
+    EtapaProjeto.CRIACAO_3_4.value: ("CRIACAO_3_4", "CRIACAO_3_4"),
+    EtapaProjeto.APROVACAO_FINAL.value: ("APROVACAO", "APROVACAO"),
+    EtapaProjeto.PLANEJAMENTO_PRODUCAO.value: ("PLANEJAMENTO", "PLANEJAMENTO"),
+    EtapaProjeto.PRE_PRODUCAO.value: ("PRE_PRODUCAO", "PRE_PRODUCAO"),
+    EtapaProjeto.PRODUCAO.value: ("PRODUCAO", "CONCLUIDO"),
+    EtapaProjeto.QUALIDADE.value: ("PRODUCAO", "CONCLUIDO"),
+    EtapaProjeto.ENTREGA.value: ("PRODUCAO", "CONCLUIDO"),
+}
+
+# Etapas fora da tabela (pós-vendas, encerrado, legadas)
+COLUNA_PADRAO = ("LANCAMENTO", "CONCLUIDO")
+
+CONCLUIDO = TarefaStatus.CONCLUIDO.value
+
+# Campos que tarefas antigas podem não ter; preenchidos uma vez no banco
+# (preencher_campos_tarefas), e não a cada leitura
+CAMPOS_PADRAO_TAREFA = {
+    "macro_etapa": MacroEtapa.ATENDIMENTO.value,
+    "numero": 0,
+    "setor": "Geral",
+}
+
+
+def montar_kanban(tarefas: List[dict]) -> dict:
+    """
+    Distribui as tarefas nas colunas do Kanban
+
+    Uma consulta ao dicionário por tarefa: o custo cresce com o número de
+    tarefas, não com tarefas × colunas.
+    """
+    kanban = {
+        chave: {"titulo": titulo, "cor": cor, "tarefas": []}
+        for chave, titulo, cor in COLUNAS_KANBAN
+    }
+    for tarefa in tarefas:
+        aberta, concluida = COLUNA_POR_ETAPA.get(tarefa.get('etapa'), COLUNA_PADRAO)
+        coluna = concluida if tarefa.get('status') == CONCLUIDO else aberta
+        kanban[coluna]["tarefas"].append(tarefa)
+    return kanban
+
+
+async def preencher_campos_tarefas(db) -> int:
+    """Completa no banco os campos padrão que faltam em tarefas antigas"""
+    faltando = [{campo: {"$exists": False}} for campo in list(CAMPOS_PADRAO_TAREFA) + ["atividade"]]
+    valores = {
+        campo: {"$ifNull": [f"${campo}", padrao]}
+        for campo, padrao in CAMPOS_PADRAO_TAREFA.items()
+    }
+    valores["atividade"] = {"$ifNull": ["$atividade", {"$ifNull": ["$titulo", "Atividade"]}]}
+    valores.update(await carimbo_alteracao(db))
+
+    try:
+        result = await db.tarefas.update_many({"$or": faltando}, [{"$set": valores}])
+    finally:
+        await liberar_reservas(db)
+    return result.modified_count
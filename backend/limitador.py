@@ -0,0 +1,185 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+from pymongo import ReturnDocument
+import os
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Por conta: rajada curta e recarga lenta (força bruta numa senha)
+LOGIN_CONTA_CAPACIDADE = float(os.getenv("LOGIN_LIMITE_CONTA_CAPACIDADE", "5"))
+LOGIN_CONTA_POR_MINUTO = float(os.getenv("LOGIN_LIMITE_CONTA_POR_MINUTO", "2"))
+# Por IP: mais folgado (vários usuários atrás do mesmo NAT)
+LOGIN_IP_CAPACIDADE = float(os.getenv("LOGIN_LIMITE_IP_CAPACIDADE", "20"))
+LOGIN_IP_POR_MINUTO = float(os.getenv("LOGIN_LIMITE_IP_POR_MINUTO", "20"))
+# "1" guarda os baldes no Mongo (vários workers compartilham o limite)
+LOGIN_LIMITE_PERSISTENTE = os.getenv("LOGIN_LIMITE_PERSISTENTE", "0") == "1"
+LOGIN_LIMITE_MAX_CHAVES = int(os.getenv("LOGIN_LIMITE_MAX_CHAVES", "10000"))
+# "1" quando o backend está atrás de proxy/ingress que preenche X-Forwarded-For
+LOGIN_CONFIAR_PROXY = os.getenv("LOGIN_CONFIAR_PROXY", "0") == "1"
+
+
+def ip_cliente(request) -> Optional[str]:
+    """IP de origem da requisição (primeiro salto do X-Forwarded-For se confiável)"""
+    if LOGIN_CONFIAR_PROXY:
+        encaminhado = request.headers.get("x-forwarded-for")
+        if encaminhado:
+            return encaminhado.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+
+class BaldeTokens:
+    """
+    Token bucket por chave
+
+    Cada chave tem até `capacidade` tokens, recarregados a `por_minuto`
+    tokens por minuto. Cada tentativa consome um token; sem token, a
+    tentativa é recusada e `consumir` devolve quantos segundos faltam.
+
+    Em memória os baldes ficam num LRU limitado (chaves arbitrárias, como
+    emails inexistentes, não crescem sem limite). Com `db`, o estado fica
+    na coleção `limites_login` e é atualizado atomicamente no servidor,
+    de modo que todos os workers enxergam o mesmo balde.
+    """
+
+    def __init__(self, nome: str, capacidade: float, por_minuto: float, db=None,
+                 max_chaves: int = LOGIN_LIMITE_MAX_CHAVES):
+        self.nome = nome
+        self.capacidade = capacidade
+        self.taxa = por_minuto / 60.0
+        self.db = db
+        self.max_chaves = max_chaves
+        self.baldes: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.permitidas = 0
+        self.recusadas = 0
+
+    def _espera(self, tokens: float) -> float:
+        if self.taxa <= 0:
+            return 60.0
+        return (1 - tokens) / self.taxa
+
+    async def consumir(self, chave: str) -> float:
+        """Consome um token; retorna 0 se permitido ou os segundos até o próximo"""
+        if self.db is not None:
+            tokens = await self._consumir_mongo(chave)
+        else:
+            tokens = self._consumir_memoria(chave)
+
+        if tokens is None:
+            self.permitidas += 1
+            return 0.0
+        self.recusadas += 1
+        return self._espera(tokens)
+
+    def _consumir_memoria(self, chave: str) -> Optional[float]:
+        agora = time.monotonic()
+        tokens, atualizado = self.baldes.get(chave, (self.capacidade, agora))
+        tokens = min(self.capacidade, tokens + (agora - atualizado) * self.taxa)
+
+        permitido = tokens >= 1
+        if permitido:
+            tokens -= 1
+
+        self.baldes[chave] = (tokens, agora)
+        self.baldes.move_to_end(chave)
+        while len(self.baldes) > self.max_chaves:
+            self.baldes.popitem(last=False)
+        return None if permitido else tokens
+
+    async def _consumir_mongo(self, chave: str) -> Optional[float]:
+        agora = datetime.utcnow()
+        # Segundos até o balde encher de novo: depois disso o documento é inútil
+        ttl = self.capacidade / self.taxa if self.taxa > 0 else 3600
+        decorrido = {"$divide": [{"$subtract": [agora, {"$ifNull": ["$atualizado_em", agora]}]}, 1000]}
+
+        doc = await self.db.limites_login.find_one_and_update(
+            {"_id": f"{self.nome}:{chave}"},
+            [
+                {"$set": {
+                    "tokens": {"$min": [
+                        self.capacidade,
+                        {"$add": [{"$ifNull": ["$tokens", self.capacidade]}, {"$multiply": [decorrido, self.taxa]}]}
+                    ]},
+                    "atualizado_em": agora,
+                    "expira_em": agora + timedelta(seconds=ttl)
+                }},
+                {"$set": {"permitido": {"$gte": ["$tokens", 1]}}},
+                {"$set": {"tokens": {"$cond": ["$permitido", {"$subtract": ["$tokens", 1]}, "$tokens"]}}}
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return None if doc['permitido'] else doc['tokens']
+
+    async def liberar(self, chave: str):
+        """Enche o balde de novo (ex.: login bem-sucedido da conta)"""
+        if self.db is not None:
+            await self.db.limites_login.delete_one({"_id": f"{self.nome}:{chave}"})
+        else:
+            self.baldes.pop(chave, None)
+
+    def estatisticas(self) -> dict:
+        return {
+            "nome": self.nome,
+            "capacidade": self.capacidade,
+            "por_minuto": self.taxa * 60,
+            "chaves_em_memoria": len(self.baldes),
+            "permitidas": self.permitidas,
+            "recusadas": self.recusadas
+        }
+
+
+class LimitadorLogin:
+    """
+    Limite de tentativas de login por conta e por IP
+
+    A verificação acontece antes de qualquer consulta ou bcrypt, então uma
+    rajada recusada custa só a atualização dos baldes. Para emails
+    inexistentes o login não roda bcrypt: `aguardar_rejeicao` espera o tempo
+    médio de uma verificação real (sem usar CPU), e a resposta leva o mesmo
+    tempo que uma senha errada.
+    """
+
+    def __init__(self, db=None, persistente: bool = LOGIN_LIMITE_PERSISTENTE):
+        db_baldes = db if persistente else None
+        self.db = db_baldes
+        self.por_conta = BaldeTokens("conta", LOGIN_CONTA_CAPACIDADE, LOGIN_CONTA_POR_MINUTO, db_baldes)
+        self.por_ip = BaldeTokens("ip", LOGIN_IP_CAPACIDADE, LOGIN_IP_POR_MINUTO, db_baldes)
+        # Média móvel do tempo de verificação bcrypt (segundos)
+        self.tempo_verificacao = 0.25
+
+    async def criar_indices(self):
+        """TTL dos baldes persistidos (só no modo persistente)"""
+        if self.db is not None:
+            await self.db.limites_login.create_index("expira_em", expireAfterSeconds=0)
+
+    async def verificar(self, email: str, ip: Optional[str]) -> float:
+        """Retorna 0 se a tentativa pode seguir ou os segundos para tentar de novo"""
+        if ip:
+            espera = await self.por_ip.consumir(ip)
+            if espera:
+                return espera
+        return await self.por_conta.consumir(email.strip().lower())
+
+    async def sucesso(self, email: str):
+        """Login correto: a conta volta a ter o balde cheio"""
+        await self.por_conta.liberar(email.strip().lower())
+
+    def registrar_verificacao(self, duracao: float):
+        """Atualiza a média do tempo de uma verificação bcrypt"""
+        self.tempo_verificacao = self.tempo_verificacao * 0.9 + duracao * 0.1
+
+    async def aguardar_rejeicao(self):
+        """Espera o tempo de uma verificação real sem gastar CPU"""
+        await asyncio.sleep(self.tempo_verificacao)
+
+    def estatisticas(self) -> dict:
+        return {
+            "persistente": self.db is not None,
+            "tempo_verificacao_ms": round(self.tempo_verificacao * 1000, 2),
+            "conta": self.por_conta.estatisticas(),
+            "ip": self.por_ip.estatisticas()
+        }
@@ -0,0 +1,205 @@
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+import hmac
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Token exigido em /metrics (Authorization: Bearer ...); vazio = aberto
+METRICAS_TOKEN = os.getenv("METRICAS_TOKEN", "")
+
+# Limites dos buckets, em segundos e em bytes
+BUCKETS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BUCKETS_TAMANHO = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Rótulo para requisições que não casaram com nenhuma rota (404, OPTIONS do CORS):
+# o caminho cru não entra como rótulo para não explodir o número de séries
+ROTA_DESCONHECIDA = "desconhecida"
+
+Rotulos = Tuple[str, ...]
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_rotulos(nomes: Sequence[str], valores: Rotulos, extra: str = "") -> str:
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _formatar_numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Contador:
+    """Contador monotônico por combinação de rótulos"""
+
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.valores: Dict[Rotulos, float] = {}
+
+    def incrementar(self, rotulos: Rotulos = (), valor: float = 1):
+        self.valores[rotulos] = self.valores.get(rotulos, 0) + valor
+
+    def exportar(self) -> List[str]:
+        return [
+            f"{self.nome}{_formatar_rotulos(self.rotulos, rotulos)} {_formatar_numero(valor)}"
+            for rotulos, valor in self.valores.items()
+        ]
+
+
+class Medidor(Contador):
+    """Valor que sobe e desce (ex.: requisições em andamento)"""
+
+    tipo = "gauge"
+
+    def decrementar(self, rotulos: Rotulos = (), valor: float = 1):
+        self.valores[rotulos] = self.valores.get(rotulos, 0) - valor
+
+
+class Histograma:
+    """
+    Histograma com buckets fixos por combinação de rótulos
+
+    Guarda a contagem de cada bucket separadamente (uma busca binária e um
+    incremento por observação); o acumulado que o Prometheus espera é
+    calculado só na exportação.
+    """
+
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = (), buckets: Sequence[float] = BUCKETS_LATENCIA):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.buckets = tuple(sorted(buckets))
+        # rótulos -> [contagens por bucket (+Inf no fim), soma]
+        self.series: Dict[Rotulos, list] = {}
+
+    def observar(self, rotulos: Rotulos, valor: float):
+        serie = self.series.get(rotulos)
+        if serie is None:
+            serie = self.series[rotulos] = [[0] * (len(self.buckets) + 1), 0.0]
+        serie[0][bisect_left(self.buckets, valor)] += 1
+        serie[1] += valor
+
+    def exportar(self) -> List[str]:
+        linhas = []
+        for rotulos, (contagens, soma) in self.series.items():
+            acumulado = 0
+            for limite, contagem in zip(self.buckets + (float("inf"),), contagens):
+                acumulado += contagem
+                le = f'le="{_formatar_numero(float(limite))}"'
+                linhas.append(f"{self.nome}_bucket{_formatar_rotulos(self.rotulos, rotulos, le)} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_formatar_rotulos(self.rotulos, rotulos)} {_formatar_numero(soma)}")
+            linhas.append(f"{self.nome}_count{_formatar_rotulos(self.rotulos, rotulos)} {acumulado}")
+        return linhas
+
+
+class RegistroMetricas:
+    """Conjunto de métricas exportadas juntas no formato texto do Prometheus"""
+
+    def __init__(self):
+        self.metricas: Dict[str, object] = {}
+
+    def registrar(self, metrica):
+        self.metricas[metrica.nome] = metrica
+        return metrica
+
+    def exportar(self) -> str:
+        linhas = []
+        for metrica in self.metricas.values():
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            linhas.extend(metrica.exportar())
+        return "\n".join(linhas) + "\n"
+
+
+registro = RegistroMetricas()
+
+duracao_requisicoes = registro.registrar(Histograma(
+    "http_requisicao_duracao_segundos", "Latência das requisições HTTP por rota",
+    ("metodo", "rota")
+))
+requisicoes_em_andamento = registro.registrar(Medidor(
+    "http_requisicoes_em_andamento", "Requisições HTTP sendo atendidas agora",
+    ("metodo",)
+))
+respostas_por_status = registro.registrar(Contador(
+    "http_respostas_total", "Respostas HTTP por rota e status",
+    ("metodo", "rota", "status")
+))
+tamanho_respostas = registro.registrar(Histograma(
+    "http_resposta_tamanho_bytes", "Bytes do corpo das respostas HTTP (após compressão)",
+    ("metodo", "rota"), BUCKETS_TAMANHO
+))
+
+
+def rota_da_requisicao(scope) -> str:
+    """Template da rota casada (ex.: /api/projetos/{projeto_id}), não o caminho cru"""
+    rota = scope.get("route")
+    return getattr(rota, "path", None) or ROTA_DESCONHECIDA
+
+
+class MetricasMiddleware:
+    """
+    Latência, requisições em andamento, status e tamanho das respostas (ASGI)
+
+    Os rótulos usam o template da rota, que o roteador do FastAPI grava em
+    `scope["route"]` ao casar a requisição; por isso o rótulo é lido depois
+    de a aplicação responder. Deve ser o middleware mais externo, para
+    medir também a compressão e os bytes que vão de fato para o cliente.
+    """
+
+    def __init__(self, app, ignorar: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.ignorar = tuple(ignorar)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path", "").startswith(self.ignorar):
+            await self.app(scope, receive, send)
+            return
+
+        metodo = scope.get("method", "GET")
+        status = 500  # exceção antes de começar a resposta
+        tamanho = 0
+
+        async def enviar(mensagem):
+            nonlocal status, tamanho
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+            elif mensagem["type"] == "http.response.body":
+                tamanho += len(mensagem.get("body", b""))
+            await send(mensagem)
+
+        chave_andamento = (metodo,)
+        requisicoes_em_andamento.incrementar(chave_andamento)
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            duracao = time.perf_counter() - inicio
+            requisicoes_em_andamento.decrementar(chave_andamento)
+
+            rotulos = (metodo, rota_da_requisicao(scope))
+            duracao_requisicoes.observar(rotulos, duracao)
+            tamanho_respostas.observar(rotulos, tamanho)
+            respostas_por_status.incrementar(rotulos + (str(status),))
+
+
+def autorizado(authorization: Optional[str]) -> bool:
+    """Confere o token de /metrics, se METRICAS_TOKEN estiver configurado"""
+    if not METRICAS_TOKEN:
+        return True
+    return hmac.compare_digest(authorization or "", f"Bearer {METRICAS_TOKEN}")
@@ -2,6 +2,7 @@ from pydantic import BaseModel, Field, validator
 from typing import List, Optional, Dict
 from datetime import datetime
 from enum import Enum
+from permissoes import MASCARA_PADRAO
 import uuid
 import hashlib
 
@@ -222,6 +223,7 @@ class OperacaoResponse(BaseModel):
     logs: List[dict] = []
 
 # User e Permissões
+
 class User(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     nome: str
@@ -229,54 +231,7 @@ class User(BaseModel):
     senha_hash: str
     role: UserRole = UserRole.ATENDIMENTO
     ativo: bool = True
-    permissoes: Dict[str, bool] = {
-        # Dashboard
-        "dashboard": True,
-        
-        # Contratos
-        "contratos_visualizar": True,
-        "contratos_criar": False,
-        "contratos_editar": False,
-        "contratos_excluir": False,
-        "contratos_aprovar": False,
-        "contratos_finalizar": False,
-        
-        # Projetos
-        "projetos_visualizar": True,
-        "projetos_avancar": False,
-        "projetos_mover_etapa": False,
-        
-        # Tarefas
-        "tarefas_visualizar": True,
-        "tarefas_criar": False,
-        "tarefas_editar": False,
-        "tarefas_concluir": False,
-        "tarefas_mover": False,
-        "tarefas_excluir": False,
-        
-        # Etapas do Workflow - Permissões por etapa
-        "etapa_lancamento": False,
-        "etapa_ativacao": False,
-        "etapa_revisao": False,
-        "etapa_criacao_1_2": False,
-        "etapa_conferencia": False,
-        "etapa_ajuste_layout": False,
-        "etapa_criacao_3_4": False,
-        "etapa_aprovacao_final": False,
-        "etapa_planejamento_producao": False,
-        "etapa_pre_producao": False,
-        "etapa_producao": False,
-        "etapa_qualidade": False,
-        "etapa_entrega": False,
-        "etapa_pos_vendas": False,
-        
-        # Feedback e Interação
-        "dar_feedback": False,
-        "ver_feedback": True,
-        
-        # Admin
-        "admin": False
-    }
+    permissoes_mask: int = MASCARA_PADRAO  # ver permissoes.py
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class UserCreate(BaseModel):
@@ -301,6 +256,16 @@ class Token(BaseModel):
     access_token: str
     token_type: str
     user: dict
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None  # segundos
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class ApiKeyCreate(BaseModel):
+    nome: str  # identificação da integração (ex.: "Chão de fábrica")
+    permissoes: List[str]
+    expira_em_dias: Optional[int] = None
 
 class NotificacaoUsuario(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -0,0 +1,531 @@
+from typing import List, Optional, Dict, Tuple
+from datetime import datetime, timedelta
+from pymongo.errors import OperationFailure
+from models import NotificacaoUsuario
+import os
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Retenção (dias)
+RETENCAO_LIDAS_DIAS = int(os.getenv("NOTIFICACOES_RETENCAO_LIDAS_DIAS", "30"))
+RETENCAO_NAO_LIDAS_DIAS = int(os.getenv("NOTIFICACOES_RETENCAO_NAO_LIDAS_DIAS", "90"))
+RETENCAO_ALERTAS_DIAS = int(os.getenv("ALERTAS_RETENCAO_DIAS", "30"))
+COMPACTACAO_INTERVALO_SEGUNDOS = int(os.getenv("NOTIFICACOES_COMPACTACAO_INTERVALO", str(60 * 60 * 6)))
+
+# Janela de agrupamento (segundos); 0 desativa o digest
+DIGEST_JANELA_SEGUNDOS = float(os.getenv("NOTIFICACOES_DIGEST_JANELA", "5"))
+
+# Títulos das notificações agrupadas por tipo
+TITULOS_DIGEST = {
+    "nova_tarefa": "{n} novas tarefas atribuídas",
+    "tarefa_atrasada": "⚠️ {n} tarefas atrasadas!",
+    "aprovacao_necessaria": "{n} aprovações necessárias",
+}
+LINKS_DIGEST = {
+    "nova_tarefa": "/tarefas",
+    "tarefa_atrasada": "/tarefas",
+    "aprovacao_necessaria": "/projetos",
+}
+
+
+def filtro_nao_lidas(user_id: str, lido_ate: Optional[str]) -> dict:
+    """Filtro das não lidas: sem leitura individual e criadas depois do watermark"""
+    filtro = {"user_id": user_id, "lida": False}
+    if lido_ate:
+        filtro["created_at"] = {"$gt": lido_ate}
+    return filtro
+
+
+def estagios_nao_lidas(match: dict) -> List[dict]:
+    """Estágios de agregação que aplicam o watermark de cada usuário"""
+    return [
+        {"$match": match},
+        {"$lookup": {
+            "from": "notificacoes_contadores",
+            "localField": "user_id",
+            "foreignField": "user_id",
+            "as": "_contador"
+        }},
+        {"$match": {"$expr": {
+            "$gt": ["$created_at", {"$ifNull": [{"$arrayElemAt": ["$_contador.lido_ate", 0]}, ""]}]
+        }}}
+    ]
+
+
+class ContadorNotificacoes:
+    """
+    Contador de notificações não lidas por usuário
+
+    Mantém um documento pequeno por usuário em `notificacoes_contadores`,
+    atualizado incrementalmente nas inserções e leituras. O badge passa a
+    ser um find_one por chave em vez de um count_documents a cada polling.
+
+    O mesmo documento guarda `lido_ate`: tudo criado até esse instante conta
+    como lido, mesmo com `lida: False` no documento da notificação.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.colecao = db.notificacoes_contadores
+
+    async def criar_indices(self):
+        """Cria índice único por usuário"""
+        await self.colecao.create_index("user_id", unique=True)
+
+    async def incrementar(self, user_id: str, quantidade: int = 1):
+        """Soma novas notificações não lidas ao contador do usuário"""
+        if quantidade <= 0:
+            return
+        await self.colecao.update_one(
+            {"user_id": user_id},
+            {
+                "$inc": {"nao_lidas": quantidade},
+                "$set": {"updated_at": datetime.utcnow().isoformat()}
+            },
+            upsert=True
+        )
+
+    async def decrementar(self, user_id: str, quantidade: int = 1):
+        """Subtrai notificações lidas, sem deixar o contador negativo"""
+        if quantidade <= 0:
+            return
+        result = await self.colecao.update_one(
+            {"user_id": user_id, "nao_lidas": {"$gte": quantidade}},
+            {
+                "$inc": {"nao_lidas": -quantidade},
+                "$set": {"updated_at": datetime.utcnow().isoformat()}
+            }
+        )
+        if result.matched_count == 0:
+            # Contador divergente da fonte: recalcular
+            await self.recontar(user_id)
+
+    async def avancar_lido_ate(self, user_id: str) -> str:
+        """Marca todas como lidas com uma única escrita: avança o watermark e zera o contador"""
+        agora = datetime.utcnow().isoformat()
+        await self.colecao.update_one(
+            {"user_id": user_id},
+            {"$set": {"nao_lidas": 0, "lido_ate": agora, "updated_at": agora}},
+            upsert=True
+        )
+        return agora
+
+    async def obter_lido_ate(self, user_id: str) -> Optional[str]:
+        """Watermark de leitura do usuário (None se nunca marcou todas)"""
+        contador = await self.colecao.find_one({"user_id": user_id}, {"_id": 0, "lido_ate": 1})
+        return (contador or {}).get('lido_ate')
+
+    async def obter(self, user_id: str) -> int:
+        """Retorna o total de não lidas; inicializa a partir da fonte se não existir"""
+        contador = await self.colecao.find_one({"user_id": user_id}, {"_id": 0, "nao_lidas": 1})
+        if contador is None:
+            return await self.recontar(user_id)
+        return max(0, contador.get('nao_lidas', 0))
+
+    async def contar_fonte(self, user_id: str) -> int:
+        """Conta as não lidas diretamente na caixa de entrada"""
+        return await self.db.notificacoes_usuarios.count_documents(
+            filtro_nao_lidas(user_id, await self.obter_lido_ate(user_id))
+        )
+
+    async def recontar(self, user_id: Optional[str] = None) -> int:
+        """
+        Rotina de reparo: recalcula o contador a partir da fonte
+
+        - Com user_id: recalcula apenas esse usuário e retorna o total
+        - Sem user_id: recalcula todos os usuários e retorna quantos foram corrigidos
+        """
+        if user_id is not None:
+            total = await self.contar_fonte(user_id)
+            await self.colecao.update_one(
+                {"user_id": user_id},
+                {"$set": {"nao_lidas": total, "updated_at": datetime.utcnow().isoformat()}},
+                upsert=True
+            )
+            return total
+
+        totais = {}
+        pipeline = [
+            *estagios_nao_lidas({"lida": False}),
+            {"$group": {"_id": "$user_id", "total": {"$sum": 1}}}
+        ]
+        async for grupo in self.db.notificacoes_usuarios.aggregate(pipeline):
+            if grupo['_id'] is not None:
+                totais[grupo['_id']] = grupo['total']
+
+        agora = datetime.utcnow().isoformat()
+        # Usuários sem nenhuma não lida também precisam ser zerados
+        async for contador in self.colecao.find({}, {"_id": 0, "user_id": 1}):
+            totais.setdefault(contador['user_id'], 0)
+
+        for uid, total in totais.items():
+            await self.colecao.update_one(
+                {"user_id": uid},
+                {"$set": {"nao_lidas": total, "updated_at": agora}},
+                upsert=True
+            )
+
+        logger.info(f"Contadores de notificações recalculados para {len(totais)} usuário(s)")
+        return len(totais)
+
+
+class CaixaNotificacoes:
+    """
+    Caixa de entrada única de notificações (`notificacoes_usuarios`)
+
+    Todas as notificações de usuário usam o schema NotificacaoUsuario e são
+    lidas por consultas cobertas pelo índice (user_id, lida, created_at, id).
+    A coleção `notificacoes` fica restrita à saída de e-mails do WorkflowEngine.
+    """
+
+    LIMITE_PADRAO = 50
+    LIMITE_MAXIMO = 100
+
+    def __init__(self, db, contador: ContadorNotificacoes):
+        self.db = db
+        self.contador = contador
+        self.colecao = db.notificacoes_usuarios
+
+    async def criar_indices(self):
+        """Índice composto da listagem (com `id` para o cursor) e índice único por id"""
+        await self.colecao.create_index([("user_id", 1), ("lida", 1), ("created_at", -1), ("id", -1)])
+        await self.colecao.create_index("id", unique=True)
+        # Índice anterior, sem `id`: prefixo do novo
+        try:
+            await self.colecao.drop_index("user_id_1_lida_1_created_at_-1")
+        except OperationFailure:
+            pass
+
+    async def listar(
+        self,
+        user_id: str,
+        limite: int = LIMITE_PADRAO,
+        cursor: Optional[str] = None,
+        apenas_nao_lidas: bool = False
+    ) -> Tuple[List[dict], Optional[str]]:
+        """
+        Lista uma página da caixa de entrada, mais recentes primeiro
+
+        - cursor: "created_at|id" do último item da página anterior;
+          created_at não é único (migradas, inserções no mesmo instante),
+          então o id desempata
+        - Retorna (notificações, próximo cursor ou None)
+        """
+        limite = max(1, min(limite, self.LIMITE_MAXIMO))
+        lido_ate = await self.contador.obter_lido_ate(user_id)
+
+        if apenas_nao_lidas:
+            filtro = filtro_nao_lidas(user_id, lido_ate)
+        else:
+            # `lida` sempre na consulta: com $in o Mongo percorre o índice nos dois
+            # valores e faz merge ordenado, sem etapa de SORT em memória
+            filtro = {"user_id": user_id, "lida": {"$in": [False, True]}}
+        if cursor:
+            criado_em, _, ultimo_id = cursor.partition("|")
+            if ultimo_id:
+                filtro["$or"] = [
+                    {"created_at": {"$lt": criado_em}},
+                    {"created_at": criado_em, "id": {"$lt": ultimo_id}}
+                ]
+            else:  # cursor antigo, só com created_at
+                filtro.setdefault("created_at", {})["$lt"] = criado_em
+
+        notificacoes = await self.colecao.find(filtro, {"_id": 0}).sort(
+            [("created_at", -1), ("id", -1)]
+        ).to_list(limite)
+
+        # Aplicar o watermark de "marcar todas como lidas"
+        if lido_ate:
+            for notificacao in notificacoes:
+                if notificacao.get('created_at', '') <= lido_ate:
+                    notificacao['lida'] = True
+
+        proximo_cursor = None
+        if len(notificacoes) == limite:
+            ultima = notificacoes[-1]
+            proximo_cursor = f"{ultima['created_at']}|{ultima['id']}"
+        return notificacoes, proximo_cursor
+
+    async def marcar_lida(self, notificacao_id: str, user_id: Optional[str] = None) -> bool:
+        """Marca uma notificação como lida; retorna False se não havia não lida correspondente"""
+        filtro = {"id": notificacao_id, "lida": False}
+        if user_id is not None:
+            filtro["user_id"] = user_id
+        notificacao = await self.colecao.find_one_and_update(
+            filtro,
+            {"$set": {"lida": True, "lida_em": datetime.utcnow()}},
+            projection={"_id": 0, "user_id": 1, "created_at": 1}
+        )
+        if not notificacao:
+            return False
+        # Se já estava coberta pelo watermark, não contava como não lida
+        lido_ate = await self.contador.obter_lido_ate(notificacao['user_id'])
+        if not lido_ate or notificacao.get('created_at', '') > lido_ate:
+            await self.contador.decrementar(notificacao['user_id'])
+        return True
+
+    async def marcar_todas_lidas(self, user_id: str) -> str:
+        """
+        Marca todas as notificações do usuário como lidas
+
+        Não reescreve as notificações: apenas avança o watermark `lido_ate`
+        no documento do contador. Retorna o novo watermark.
+        """
+        return await self.contador.avancar_lido_ate(user_id)
+
+    async def migrar(self) -> dict:
+        """
+        Migra notificações de usuário gravadas em `notificacoes` para a caixa única
+
+        Idempotente: documentos são gravados por id (upsert) e removidos da origem.
+        """
+        migradas = 0
+        ids_migrados = []
+        async for antiga in self.db.notificacoes.find({"usuario_id": {"$exists": True}}, {"_id": 0}):
+            created_at = antiga.get('created_at')
+            if isinstance(created_at, datetime):
+                created_at = created_at.isoformat()
+
+            nova = {
+                "id": antiga['id'],
+                "user_id": antiga['usuario_id'],
+                "tipo": str(antiga.get('tipo', 'outros')),
+                "titulo": antiga.get('titulo', ''),
+                "mensagem": antiga.get('mensagem', ''),
+                "link": f"/tarefas?tarefa_id={antiga['tarefa_id']}" if antiga.get('tarefa_id') else None,
+                "lida": antiga.get('lida', False),
+                "created_at": created_at or datetime.utcnow().isoformat()
+            }
+            if antiga.get('lida_em'):
+                nova['lida_em'] = antiga['lida_em']
+
+            await self.colecao.replace_one({"id": nova['id']}, nova, upsert=True)
+            ids_migrados.append(nova['id'])
+            migradas += 1
+
+        if ids_migrados:
+            await self.db.notificacoes.delete_many({"id": {"$in": ids_migrados}})
+            await self.contador.recontar()
+            logger.info(f"{migradas} notificação(ões) migradas para a caixa de entrada única")
+
+        return {"migradas": migradas}
+
+
+class RetencaoNotificacoes:
+    """
+    Retenção e compactação das coleções de notificações
+
+    - Lidas expiram via índice TTL sobre `lida_em` (data BSON gravada ao marcar como lida)
+    - Não lidas antigas são consolidadas em um resumo por usuário (`notificacoes_resumos`)
+    - Alertas e e-mails antigos são removidos
+    """
+
+    def __init__(self, db, contador: ContadorNotificacoes):
+        self.db = db
+        self.contador = contador
+
+    async def criar_indices(self):
+        """Índice TTL das notificações lidas"""
+        await self._garantir_ttl(self.db.notificacoes_usuarios, "lida_em", RETENCAO_LIDAS_DIAS)
+        await self.db.notificacoes_resumos.create_index("user_id", unique=True)
+
+    async def _garantir_ttl(self, colecao, campo: str, dias: int):
+        """Cria o índice TTL ou ajusta o prazo se a configuração mudou"""
+        segundos = dias * 24 * 60 * 60
+        try:
+            await colecao.create_index(campo, expireAfterSeconds=segundos)
+        except OperationFailure:
+            # Índice já existe com outro prazo: atualizar sem recriar
+            await self.db.command({
+                "collMod": colecao.name,
+                "index": {"keyPattern": {campo: 1}, "expireAfterSeconds": segundos}
+            })
+
+    async def compactar(self) -> dict:
+        """Executa uma rodada de compactação e retorna estatísticas"""
+        agora = datetime.utcnow()
+        limite_nao_lidas = (agora - timedelta(days=RETENCAO_NAO_LIDAS_DIAS)).isoformat()
+        limite_lidas = (agora - timedelta(days=RETENCAO_LIDAS_DIAS)).isoformat()
+        limite_alertas = (agora - timedelta(days=RETENCAO_ALERTAS_DIAS)).isoformat()
+
+        stats = {"nao_lidas_arquivadas": 0, "lidas_removidas": 0}
+
+        colecao = self.db.notificacoes_usuarios
+
+        # Lidas pelo watermark não têm `lida_em` e não expiram pelo TTL
+        marcas = {}
+        async for contador in self.contador.colecao.find(
+            {"lido_ate": {"$exists": True}}, {"_id": 0, "user_id": 1, "lido_ate": 1}
+        ):
+            marcas[contador['user_id']] = contador['lido_ate']
+            result = await colecao.delete_many({
+                "user_id": contador['user_id'],
+                "lida": False,
+                "created_at": {"$lt": min(contador['lido_ate'], limite_lidas)}
+            })
+            stats['lidas_removidas'] += result.deleted_count
+
+        # Consolidar não lidas antigas em resumo por usuário
+        filtro = {"lida": False, "created_at": {"$lt": limite_nao_lidas}}
+        pipeline = [
+            *estagios_nao_lidas(filtro),
+            {"$group": {
+                "_id": {"usuario": "$user_id", "tipo": "$tipo"},
+                "total": {"$sum": 1},
+                "mais_antiga": {"$min": "$created_at"},
+                "mais_recente": {"$max": "$created_at"}
+            }}
+        ]
+        por_usuario = {}
+        async for grupo in colecao.aggregate(pipeline):
+            user_id = grupo['_id'].get('usuario')
+            if user_id is None:
+                continue
+            resumo = por_usuario.setdefault(user_id, {"total": 0, "por_tipo": {}, "mais_antiga": None, "mais_recente": None})
+            resumo['total'] += grupo['total']
+            tipo = str(grupo['_id'].get('tipo') or 'outros')
+            resumo['por_tipo'][tipo] = resumo['por_tipo'].get(tipo, 0) + grupo['total']
+            resumo['mais_antiga'] = min(filter(None, [resumo['mais_antiga'], grupo['mais_antiga']]))
+            resumo['mais_recente'] = max(filter(None, [resumo['mais_recente'], grupo['mais_recente']]))
+
+        for user_id, resumo in por_usuario.items():
+            await self._arquivar(user_id, resumo)
+            filtro_usuario = filtro_nao_lidas(user_id, marcas.get(user_id))
+            filtro_usuario.setdefault("created_at", {})["$lt"] = limite_nao_lidas
+            result = await colecao.delete_many(filtro_usuario)
+            await self.contador.decrementar(user_id, result.deleted_count)
+            stats['nao_lidas_arquivadas'] += result.deleted_count
+
+        # Lidas antigas sem `lida_em` (anteriores ao TTL) não expiram sozinhas
+        result = await colecao.delete_many({
+            "lida": True,
+            "lida_em": {"$exists": False},
+            "created_at": {"$lt": limite_lidas}
+        })
+        stats['lidas_removidas'] += result.deleted_count
+
+        # Saída de e-mails (`notificacoes`) não é lida por usuários
+        result = await self.db.notificacoes.delete_many({"created_at": {"$lt": limite_nao_lidas}})
+        stats['emails_removidos'] = result.deleted_count
+
+        result = await self.db.alertas.delete_many({"created_at": {"$lt": limite_alertas}})
+        stats['alertas_removidos'] = result.deleted_count
+
+        logger.info(f"Compactação de notificações concluída: {stats}")
+        return stats
+
+    async def _arquivar(self, user_id: str, resumo: dict):
+        """Soma as notificações arquivadas ao resumo do usuário"""
+        atual = await self.db.notificacoes_resumos.find_one({"user_id": user_id}, {"_id": 0}) or {}
+        mais_antiga = min(filter(None, [atual.get('mais_antiga'), resumo['mais_antiga']]))
+        mais_recente = max(filter(None, [atual.get('mais_recente'), resumo['mais_recente']]))
+
+        await self.db.notificacoes_resumos.update_one(
+            {"user_id": user_id},
+            {
+                "$inc": {
+                    "total_arquivadas": resumo['total'],
+                    **{f"por_tipo.{tipo}": n for tipo, n in resumo['por_tipo'].items()}
+                },
+                "$set": {
+                    "mais_antiga": mais_antiga,
+                    "mais_recente": mais_recente,
+                    "updated_at": datetime.utcnow().isoformat()
+                }
+            },
+            upsert=True
+        )
+
+    async def obter_resumo(self, user_id: str) -> dict:
+        """Resumo das notificações arquivadas do usuário"""
+        resumo = await self.db.notificacoes_resumos.find_one({"user_id": user_id}, {"_id": 0})
+        return resumo or {"user_id": user_id, "total_arquivadas": 0, "por_tipo": {}}
+
+
+class DigestNotificacoes:
+    """
+    Agrupa rajadas de notificações do mesmo tipo para o mesmo usuário
+
+    A primeira notificação de um (usuário, tipo) abre uma janela curta;
+    as que chegarem dentro dela são mescladas em uma única notificação
+    listando os itens. Uma rajada de N tarefas vira 1 documento.
+    """
+
+    def __init__(self, db, contador: ContadorNotificacoes, janela: float = DIGEST_JANELA_SEGUNDOS):
+        self.db = db
+        self.contador = contador
+        self.janela = janela
+        self.buffer: Dict[Tuple[str, str], List[NotificacaoUsuario]] = {}
+        self.agendamentos: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    async def adicionar(self, notificacao: NotificacaoUsuario):
+        """Enfileira a notificação na janela do usuário (ou grava direto se desativado)"""
+        if self.janela <= 0:
+            await self._persistir(notificacao)
+            return
+
+        chave = (notificacao.user_id, notificacao.tipo)
+        self.buffer.setdefault(chave, []).append(notificacao)
+        if chave not in self.agendamentos:
+            self.agendamentos[chave] = asyncio.create_task(self._descarregar_apos_janela(chave))
+
+    async def _descarregar_apos_janela(self, chave: Tuple[str, str]):
+        # Cancelamento vem de descarregar_todas, que grava o buffer por conta própria
+        await asyncio.sleep(self.janela)
+        self.agendamentos.pop(chave, None)
+        try:
+            await self.descarregar(chave)
+        except Exception as e:
+            logger.error(f"Erro ao gravar digest de notificações {chave}: {str(e)}")
+
+    async def descarregar(self, chave: Tuple[str, str]):
+        """Grava o que estiver acumulado para a chave como uma única notificação"""
+        pendentes = self.buffer.pop(chave, [])
+        if not pendentes:
+            return
+        await self._persistir(self._mesclar(pendentes))
+
+    async def descarregar_todas(self):
+        """Grava todos os buffers pendentes (usado no shutdown)"""
+        for tarefa in list(self.agendamentos.values()):
+            tarefa.cancel()
+        self.agendamentos.clear()
+        for chave in list(self.buffer.keys()):
+            try:
+                await self.descarregar(chave)
+            except Exception as e:
+                logger.error(f"Erro ao gravar digest de notificações {chave}: {str(e)}")
+
+    def _mesclar(self, pendentes: List[NotificacaoUsuario]) -> NotificacaoUsuario:
+        if len(pendentes) == 1:
+            return pendentes[0]
+
+        primeira = pendentes[0]
+        n = len(pendentes)
+        # Só os modelos de TITULOS_DIGEST passam por format: o título de outros
+        # tipos é texto livre e pode conter chaves
+        if primeira.tipo in TITULOS_DIGEST:
+            titulo = TITULOS_DIGEST[primeira.tipo].format(n=n)
+        else:
+            titulo = f"{primeira.titulo} ({n})"
+        mensagem = "\n".join(f"• {p.mensagem}" for p in pendentes)
+
+        return NotificacaoUsuario(
+            user_id=primeira.user_id,
+            tipo=primeira.tipo,
+            titulo=titulo,
+            mensagem=mensagem,
+            link=LINKS_DIGEST.get(primeira.tipo, primeira.link)
+        )
+
+    async def _persistir(self, notificacao: NotificacaoUsuario):
+        notif_dict = notificacao.dict()
+        # Data da gravação, não da criação no buffer: se o usuário marcou
+        # tudo como lido durante a janela, a notificação ainda chega não lida
+        # (created_at > lido_ate), coerente com o incremento do contador
+        notif_dict['created_at'] = datetime.utcnow().isoformat()
+
+        await self.db.notificacoes_usuarios.insert_one(notif_dict)
+        await self.contador.incrementar(notificacao.user_id)
@@ -0,0 +1,148 @@
+from typing import Optional
+from pymongo.errors import OperationFailure, PyMongoError
+from versoes import notificar_alteracao, COLECOES_VERSIONADAS
+from auth import invalidar_usuario
+import os
+import asyncio
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+CHANGE_STREAMS_ATIVO = os.getenv("CHANGE_STREAMS_ATIVO", "1") == "1"
+# Um nome por serviço; workers do mesmo serviço compartilham o token salvo
+CHANGE_STREAM_NOME = os.getenv("CHANGE_STREAM_NOME", "invalidacao")
+TOKEN_SALVAR_INTERVALO_SEGUNDOS = 5
+RECONEXAO_ESPERA_SEGUNDOS = 5
+
+COLECOES_OBSERVADAS = list(COLECOES_VERSIONADAS) + ["users"]
+
+# Códigos do servidor
+NAO_E_REPLICA_SET = (40573, 20)
+TOKEN_INVALIDO = (260, 280, 286)  # InvalidResumeToken, ChangeStreamFatalError, ChangeStreamHistoryLost
+
+
+class OuvinteAlteracoes:
+    """
+    Invalidação de caches entre workers via change streams do Mongo
+
+    Cada worker observa inserts, updates, replaces e deletes em contratos,
+    projetos, tarefas e users e os converte em eventos locais:
+    - contratos/projetos/tarefas: `notificar_alteracao` (ex.: cache da esteira)
+    - users: `invalidar_usuario` pelo campo `id` do documento
+
+    O resume token é salvo em `controle_change_streams` para retomar do
+    mesmo ponto após reconexão ou restart. Se o token não puder ser usado,
+    o stream recomeça do zero e todos os caches são limpos.
+
+    Change streams exigem replica set. Para testar localmente, um nó basta:
+        mongod --replSet rs0 --dbpath /tmp/rs0
+        mongosh --eval 'rs.initiate()'
+    e rode `python ouvinte_alteracoes.py` para ver os eventos no terminal.
+    Em servidor standalone o ouvinte registra um aviso e fica inativo.
+    """
+
+    def __init__(self, db, nome: str = CHANGE_STREAM_NOME):
+        self.db = db
+        self.nome = nome
+        self.eventos = 0
+        self.ativo = False
+        self._token_salvo_em = 0.0
+
+    def _pipeline(self):
+        return [
+            {"$match": {
+                "ns.coll": {"$in": COLECOES_OBSERVADAS},
+                "operationType": {"$in": ["insert", "update", "replace", "delete"]}
+            }},
+            # Só o necessário para invalidar (updateLookup traz o doc inteiro)
+            {"$project": {"operationType": 1, "ns": 1, "documentKey": 1, "fullDocument.id": 1}}
+        ]
+
+    async def _carregar_token(self) -> Optional[dict]:
+        controle = await self.db.controle_change_streams.find_one({"_id": self.nome})
+        return controle.get('resume_token') if controle else None
+
+    async def _salvar_token(self, token: Optional[dict], forcar: bool = False):
+        agora = time.monotonic()
+        if token is None or (not forcar and agora - self._token_salvo_em < TOKEN_SALVAR_INTERVALO_SEGUNDOS):
+            return
+        self._token_salvo_em = agora
+        await self.db.controle_change_streams.update_one(
+            {"_id": self.nome},
+            {"$set": {"resume_token": token, "eventos": self.eventos}},
+            upsert=True
+        )
+
+    def processar(self, mudanca: dict):
+        """Converte um evento do change stream em invalidação local"""
+        colecao = mudanca.get('ns', {}).get('coll')
+        self.eventos += 1
+        if colecao == "users":
+            documento = mudanca.get('fullDocument') or {}
+            # Delete não traz o documento: sem o id, limpa o cache inteiro
+            invalidar_usuario(documento.get('id'))
+        elif colecao in COLECOES_VERSIONADAS:
+            notificar_alteracao(colecao)
+
+    def _invalidar_tudo(self):
+        invalidar_usuario()
+        notificar_alteracao(*COLECOES_VERSIONADAS)
+
+    async def executar(self):
+        """Loop do change stream; roda como tarefa de fundo até o shutdown"""
+        token = await self._carregar_token()
+        try:
+            while True:
+                try:
+                    async with self.db.watch(
+                        self._pipeline(), full_document="updateLookup", resume_after=token
+                    ) as stream:
+                        self.ativo = True
+                        logger.info(f"Change stream '{self.nome}' ativo ({'retomado' if token else 'novo'})")
+                        async for mudanca in stream:
+                            self.processar(mudanca)
+                            token = stream.resume_token
+                            await self._salvar_token(token)
+                except OperationFailure as e:
+                    self.ativo = False
+                    if e.code in NAO_E_REPLICA_SET:
+                        logger.warning("Change streams indisponíveis (MongoDB sem replica set); invalidação só local")
+                        return
+                    if e.code in TOKEN_INVALIDO:
+                        logger.warning(f"Resume token do change stream inutilizável ({e.code}); recomeçando")
+                        token = None
+                        self._invalidar_tudo()
+                        continue
+                    logger.error(f"Erro no change stream: {str(e)}")
+                except PyMongoError as e:
+                    self.ativo = False
+                    logger.error(f"Change stream desconectado: {str(e)}")
+                await asyncio.sleep(RECONEXAO_ESPERA_SEGUNDOS)
+        finally:
+            self.ativo = False
+            try:
+                await self._salvar_token(token, forcar=True)
+            except Exception:
+                pass
+
+    def estatisticas(self) -> dict:
+        return {"nome": self.nome, "ativo": self.ativo, "eventos": self.eventos}
+
+
+if __name__ == "__main__":
+    # Teste manual contra um replica set local: imprime cada evento recebido
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from dotenv import load_dotenv
+    from pathlib import Path
+
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO)
+
+    class OuvinteTeste(OuvinteAlteracoes):
+        def processar(self, mudanca: dict):
+            super().processar(mudanca)
+            print(mudanca['operationType'], mudanca['ns']['coll'], mudanca.get('documentKey'))
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    asyncio.run(OuvinteTeste(client[os.environ['DB_NAME']], nome="teste").executar())
@@ -0,0 +1,135 @@
+from typing import Dict, Optional
+
+# Registro das permissões conhecidas: a posição na lista é o bit na máscara
+# compilada (tokens e documentos). Só acrescentar no final, nunca reordenar.
+PERMISSOES_REGISTRADAS = [
+    "dashboard",
+    "contratos_visualizar",
+    "contratos_criar",
+    "contratos_editar",
+    "contratos_excluir",
+    "contratos_aprovar",
+    "contratos_finalizar",
+    "projetos_visualizar",
+    "projetos_avancar",
+    "projetos_mover_etapa",
+    "tarefas_visualizar",
+    "tarefas_criar",
+    "tarefas_editar",
+    "tarefas_concluir",
+    "tarefas_mover",
+    "tarefas_excluir",
+    "etapa_lancamento",
+    "etapa_ativacao",
+    "etapa_revisao",
+    "etapa_criacao_1_2",
+    "etapa_conferencia",
+    "etapa_ajuste_layout",
+    "etapa_criacao_3_4",
+    "etapa_aprovacao_final",
+    "etapa_planejamento_producao",
+    "etapa_pre_producao",
+    "etapa_producao",
+    "etapa_qualidade",
+    "etapa_entrega",
+    "etapa_pos_vendas",
+    "dar_feedback",
+    "ver_feedback",
+    "admin",
+]
+
+# Bit de cada permissão, calculado uma vez
+BITS_PERMISSOES = {nome: 1 << bit for bit, nome in enumerate(PERMISSOES_REGISTRADAS)}
+MASCARA_TOTAL = (1 << len(PERMISSOES_REGISTRADAS)) - 1
+
+# Permissões padrão de novos usuários
+PERMISSOES_PADRAO = {
+    # Dashboard
+    "dashboard": True,
+    
+    # Contratos
+    "contratos_visualizar": True,
+    "contratos_criar": False,
+    "contratos_editar": False,
+    "contratos_excluir": False,
+    "contratos_aprovar": False,
+    "contratos_finalizar": False,
+    
+    # Projetos
+    "projetos_visualizar": True,
+    "projetos_avancar": False,
+    "projetos_mover_etapa": False,
+    
+    # Tarefas
+    "tarefas_visualizar": True,
+    "tarefas_criar": False,
+    "tarefas_editar": False,
+    "tarefas_concluir": False,
+    "tarefas_mover": False,
+    "tarefas_excluir": False,
+    
+    # Etapas do Workflow - Permissões por etapa
+    "etapa_lancamento": False,
+    "etapa_ativacao": False,
+    "etapa_revisao": False,
+    "etapa_criacao_1_2": False,
+    "etapa_conferencia": False,
+    "etapa_ajuste_layout": False,
+    "etapa_criacao_3_4": False,
+    "etapa_aprovacao_final": False,
+    "etapa_planejamento_producao": False,
+    "etapa_pre_producao": False,
+    "etapa_producao": False,
+    "etapa_qualidade": False,
+    "etapa_entrega": False,
+    "etapa_pos_vendas": False,
+    
+    # Feedback e Interação
+    "dar_feedback": False,
+    "ver_feedback": True,
+    
+    # Admin
+    "admin": False
+}
+
+
+
+def compilar_permissoes(permissoes: Dict[str, bool]) -> int:
+    """Converte o dict de permissões em máscara de bits; rejeita nomes desconhecidos"""
+    desconhecidas = [nome for nome in permissoes if nome not in BITS_PERMISSOES]
+    if desconhecidas:
+        raise ValueError(f"Permissões desconhecidas: {', '.join(desconhecidas)}")
+
+    mascara = 0
+    for nome, ativa in permissoes.items():
+        if ativa:
+            mascara |= BITS_PERMISSOES[nome]
+    return mascara
+
+
+def expandir_permissoes(mascara: int) -> Dict[str, bool]:
+    """Converte a máscara de volta para o dict (respostas para o frontend)"""
+    return {nome: bool(mascara & bit) for nome, bit in BITS_PERMISSOES.items()}
+
+
+def tem_permissao(mascara: int, permissao: str) -> bool:
+    """Verifica uma permissão com um único AND"""
+    return bool(mascara & BITS_PERMISSOES.get(permissao, 0))
+
+
+def mascara_usuario(user: dict) -> int:
+    """Máscara do usuário; aceita documentos antigos que ainda têm o dict `permissoes`"""
+    if 'permissoes_mask' in user:
+        return user['permissoes_mask']
+    permissoes = user.get('permissoes') or {}
+    return compilar_permissoes({k: v for k, v in permissoes.items() if k in BITS_PERMISSOES})
+
+
+def mascara_role(role: Optional[str]) -> int:
+    """Máscara inicial por perfil"""
+    if role == "Administrador":
+        return MASCARA_TOTAL
+    return MASCARA_PADRAO
+
+
+MASCARA_PADRAO = compilar_permissoes(PERMISSOES_PADRAO)
@@ -0,0 +1,42 @@
+from decimal import Decimal
+from typing import Any
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+import orjson
+
+# Chaves não-string (ex.: int) aceitas como no json da biblioteca padrão
+OPCOES_ORJSON = orjson.OPT_NON_STR_KEYS
+
+
+def _padrao(valor: Any):
+    """Tipos que o orjson não conhece nativamente"""
+    if isinstance(valor, BaseModel):
+        return valor.dict()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (set, frozenset)):
+        return list(valor)
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+
+class RespostaJSON(JSONResponse):
+    """
+    Resposta JSON serializada com orjson (classe padrão da aplicação)
+
+    datetime, Enum (EtapaProjeto, TarefaStatus, ...) e UUID são codificados
+    nativamente, no mesmo formato que o jsonable_encoder produziria.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_padrao, option=OPCOES_ORJSON)
+
+
+def resposta_json(conteudo: Any, response=None) -> RespostaJSON:
+    """
+    Caminho rápido: devolve a resposta já serializada
+
+    Handlers que retornam dicts/listas vindos do banco podem usar isto para
+    pular o jsonable_encoder do FastAPI, que percorre cada item. Os headers
+    já gravados no `response` injetado (ex.: ETag) são mantidos.
+    """
+    return RespostaJSON(conteudo, headers=dict(response.headers) if response is not None else None)
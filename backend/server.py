@@ -1,24 +1,56 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from motor.motor_asyncio import AsyncIOMotorClient
 from dotenv import load_dotenv
 from pathlib import Path
 import os
+import asyncio
+import csv
+import io
+import json
 import logging
+import time
 from datetime import datetime, timedelta
 from typing import List, Optional
+from pydantic import ValidationError
 
 from models import (
     Contrato, ContratoCreate, ContratoUpdate, ContratoStatus,
     Projeto, ProjetoUpdate, EtapaProjeto,
     Tarefa, TarefaCreate, TarefaUpdate, TarefaStatus,
     Alerta, Notificacao, TipoNotificacao, OperacaoResponse, Log, NivelRisco,
-    User, UserCreate, UserUpdate, UserLogin, UserRole, NotificacaoUsuario, Token,
+    User, UserCreate, UserUpdate, UserLogin, UserRole, NotificacaoUsuario, Token, RefreshRequest, ApiKeyCreate,
     ESTEIRA_COMPLETA, MacroEtapa
 )
 from workflow_engine import WorkflowEngine
 from geradores import GeradorTarefas, GeradorNotificacoes, CalculadorCriticidade
-from auth import hash_password, verify_password, create_access_token, get_current_user, require_permission, oauth2_scheme
+from notificacoes import CaixaNotificacoes, RetencaoNotificacoes, COMPACTACAO_INTERVALO_SEGUNDOS
+from atrasos import VarreduraAtrasos, VARREDURA_ATRASOS_INTERVALO_SEGUNDOS
+from limitador import LimitadorLogin, ip_cliente
+from ouvinte_alteracoes import OuvinteAlteracoes, CHANGE_STREAMS_ATIVO
+from kanban import montar_kanban, preencher_campos_tarefas
+from versoes import (
+    incrementar_versoes, etag_versoes, etag_corresponde, ao_alterar,
+    carimbo_alteracao, registrar_exclusoes, criar_indices_sync, alteracoes_desde, compactar_exclusoes,
+    SYNC_COMPACTACAO_INTERVALO_SEGUNDOS
+)
+from cache import CacheTTL
+from coalescencia import coalescer, COALESCEDORES
+from compressao import CompressaoMiddleware
+from instrumentacao_mongo import InstrumentacaoMongoMiddleware, ouvinte_comandos, MONGO_INSTRUMENTACAO_ATIVA
+from metricas import MetricasMiddleware, registro as registro_metricas, autorizado as metricas_autorizado
+from respostas import RespostaJSON, resposta_json
+from auth import (
+    hash_password_async, hash_passwords_lote, verify_password_async, encerrar_pools_senha, get_current_user, require_permission, oauth2_scheme,
+    oauth2_scheme_opcional, api_key_header, criar_indices_api_keys, emitir_api_key, autenticar_api_key,
+    cache_usuarios, cache_tokens, invalidar_usuario, criar_token_usuario, criar_indices_auth, emitir_refresh_token,
+    consumir_refresh_token, revogar_refresh_token, revogar_refresh_tokens, migrar_permissoes_usuarios,
+    ACCESS_TOKEN_EXPIRE_MINUTES
+)
+from permissoes import (
+    PERMISSOES_REGISTRADAS, compilar_permissoes, expandir_permissoes, mascara_usuario, mascara_role
+)
 from fastapi.security import OAuth2PasswordRequestForm
 
 ROOT_DIR = Path(__file__).parent
@@ -26,19 +58,31 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Comandos atribuídos à requisição em andamento (Server-Timing, N+1; ver instrumentacao_mongo.py)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[ouvinte_comandos] if MONGO_INSTRUMENTACAO_ATIVA else [])
 db = client[os.environ['DB_NAME']]
 
 # Create the main app
-app = FastAPI(title="IDEIABH - Sistema de Gestão Operacional")
+app = FastAPI(title="IDEIABH - Sistema de Gestão Operacional", default_response_class=RespostaJSON)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
 # Initialize Workflow Engine
-workflow_engine = WorkflowEngine(db)
 gerador_tarefas = GeradorTarefas(db)
 gerador_notificacoes = GeradorNotificacoes(db)
+workflow_engine = WorkflowEngine(db, gerador_notificacoes)
+contador_notificacoes = gerador_notificacoes.contador
+caixa_notificacoes = CaixaNotificacoes(db, contador_notificacoes)
+retencao_notificacoes = RetencaoNotificacoes(db, contador_notificacoes)
+varredura_atrasos = VarreduraAtrasos(db, gerador_notificacoes)
+limitador_login = LimitadorLogin(db)
+ouvinte_alteracoes = OuvinteAlteracoes(db)
+
+# Resposta montada da esteira, por ETag; limpa a cada escrita em projetos/contratos
+ESTEIRA_CACHE_TTL = float(os.getenv("ESTEIRA_CACHE_TTL", "300"))
+cache_esteira = CacheTTL("esteira", ESTEIRA_CACHE_TTL, tamanho_maximo=4)
+ao_alterar(["projetos", "contratos"], lambda colecao: cache_esteira.limpar())
 
 # Configure logging
 logging.basicConfig(
@@ -49,6 +93,12 @@ logger = logging.getLogger(__name__)
 
 # ============ AUTENTICAÇÃO ============
 
+def usuario_resposta(user: dict) -> dict:
+    """Dados do próprio usuário para o frontend: sem senha e com permissões expandidas"""
+    resposta = {k: v for k, v in user.items() if k not in ('senha_hash', '_id')}
+    resposta['permissoes'] = expandir_permissoes(mascara_usuario(user))
+    return resposta
+
 @api_router.post("/auth/register", response_model=Token)
 async def registrar_usuario(user_data: UserCreate):
     """Registra novo usuário (primeiro será admin)"""
@@ -65,9 +115,9 @@ async def registrar_usuario(user_data: UserCreate):
         user = User(
             nome=user_data.nome,
             email=user_data.email,
-            senha_hash=hash_password(user_data.senha),
+            senha_hash=await hash_password_async(user_data.senha),
             role=UserRole.ADMIN if is_first else user_data.role,
-            permissoes={
+            permissoes_mask=compilar_permissoes({
                 "dashboard": True,
                 "contratos_visualizar": True,
                 "contratos_criar": is_first,
@@ -83,23 +133,25 @@ async def registrar_usuario(user_data: UserCreate):
                 "tarefas_concluir": True,
                 "tarefas_mover": is_first,
                 "admin": is_first
-            }
+            })
         )
         
         user_dict = user.dict()
         user_dict['created_at'] = user_dict['created_at'].isoformat()
         await db.users.insert_one(user_dict)
         
-        # Criar token
-        access_token = create_access_token(data={"sub": user.id})
+        # Criar tokens
+        access_token = criar_token_usuario(user_dict)
+        refresh_token = await emitir_refresh_token(db, user.id)
         
-        user_response = user_dict.copy()
-        del user_response['senha_hash']
+        user_response = usuario_resposta(user_dict)
         
         return Token(
             access_token=access_token,
             token_type="bearer",
-            user=user_response
+            user=user_response,
+            refresh_token=refresh_token,
+            expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60
         )
     except HTTPException as e:
         raise e
@@ -108,21 +160,36 @@ async def registrar_usuario(user_data: UserCreate):
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.post("/auth/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
     """Faz login e retorna token JWT"""
     try:
+        # Limite por conta e por IP antes de qualquer consulta ou bcrypt
+        espera = await limitador_login.verificar(form_data.username, ip_cliente(request))
+        if espera:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Muitas tentativas de login. Tente novamente em instantes.",
+                headers={"Retry-After": str(int(espera) + 1)}
+            )
+        
         user_data = await db.users.find_one({"email": form_data.username}, {"_id": 0})
         if not user_data:
+            # Sem bcrypt, mas com o mesmo tempo de resposta de uma senha errada
+            await limitador_login.aguardar_rejeicao()
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Email ou senha incorretos"
             )
         
-        if not verify_password(form_data.password, user_data['senha_hash']):
+        inicio = time.perf_counter()
+        senha_correta = await verify_password_async(form_data.password, user_data['senha_hash'])
+        limitador_login.registrar_verificacao(time.perf_counter() - inicio)
+        if not senha_correta:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Email ou senha incorretos"
             )
+        await limitador_login.sucesso(form_data.username)
         
         if not user_data.get('ativo', True):
             raise HTTPException(
@@ -130,17 +197,19 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
                 detail="Usuário inativo"
             )
         
-        # Criar token
-        access_token = create_access_token(data={"sub": user_data['id']})
+        # Criar tokens
+        access_token = criar_token_usuario(user_data)
+        refresh_token = await emitir_refresh_token(db, user_data['id'])
         
         # Retornar dados do usuário (sem senha)
-        user_response = user_data.copy()
-        del user_response['senha_hash']
+        user_response = usuario_resposta(user_data)
         
         return Token(
             access_token=access_token,
             token_type="bearer",
-            user=user_response
+            user=user_response,
+            refresh_token=refresh_token,
+            expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60
         )
     except HTTPException as e:
         raise e
@@ -148,19 +217,65 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
         logger.error(f"Erro ao fazer login: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/auth/refresh", response_model=Token)
+async def renovar_token(dados: RefreshRequest):
+    """Troca um refresh token válido por um novo par de tokens (rotação)"""
+    user_id = await consumir_refresh_token(db, dados.refresh_token)
+    if not user_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token inválido ou expirado"
+        )
+    
+    user_data = await db.users.find_one({"id": user_id}, {"_id": 0, "senha_hash": 0})
+    if not user_data:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token inválido ou expirado"
+        )
+    
+    if not user_data.get('ativo', True):
+        await revogar_refresh_tokens(db, user_id)
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Usuário inativo"
+        )
+    
+    return Token(
+        access_token=criar_token_usuario(user_data),
+        token_type="bearer",
+        user=usuario_resposta(user_data),
+        refresh_token=await emitir_refresh_token(db, user_id),
+        expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    )
+
+@api_router.post("/auth/logout")
+async def logout(dados: RefreshRequest):
+    """Revoga o refresh token da sessão"""
+    await revogar_refresh_token(db, dados.refresh_token)
+    return {"message": "Sessão encerrada"}
+
 @api_router.get("/auth/me")
 async def get_me(token: str = Depends(oauth2_scheme)):
     """Retorna dados do usuário logado"""
-    user = await get_current_user(token, db)
-    user_copy = user.copy()
-    if 'senha_hash' in user_copy:
-        del user_copy['senha_hash']
-    return user_copy
+    user = await get_current_user(token, db, completo=True)
+    return usuario_resposta(user)
 
 # ============ ADMINISTRAÇÃO ============
 
-async def get_current_user_dep(token: str = Depends(oauth2_scheme)):
-    """Dependency para obter usuário atual"""
+async def get_current_user_dep(
+    token: Optional[str] = Depends(oauth2_scheme_opcional),
+    api_key: Optional[str] = Depends(api_key_header)
+):
+    """Dependency para obter usuário atual (Bearer token ou header X-API-Key)"""
+    if api_key:
+        return await autenticar_api_key(db, api_key)
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return await get_current_user(token, db)
 
 @api_router.get("/admin/users")
@@ -168,12 +283,21 @@ async def listar_usuarios(current_user: dict = Depends(get_current_user_dep)):
     """Lista todos os usuários (apenas admin)"""
     await require_permission("admin", current_user)
     
-    users = await db.users.find({}, {"_id": 0}).to_list(1000)
+    # Só a máscara compilada; o frontend decodifica com GET /admin/permissoes
+    users = await db.users.find({}, {"_id": 0, "senha_hash": 0}).to_list(1000)
     for user in users:
-        if 'senha_hash' in user:
-            del user['senha_hash']
+        if 'permissoes' in user:
+            user['permissoes_mask'] = mascara_usuario(user)
+            del user['permissoes']
     return users
 
+@api_router.get("/admin/permissoes")
+async def listar_permissoes(current_user: dict = Depends(get_current_user_dep)):
+    """Registro de permissões: a posição de cada nome é o bit em permissoes_mask"""
+    await require_permission("admin", current_user)
+    
+    return PERMISSOES_REGISTRADAS
+
 @api_router.post("/admin/users")
 async def criar_usuario_admin(
     user_data: UserCreate,
@@ -190,8 +314,9 @@ async def criar_usuario_admin(
         user = User(
             nome=user_data.nome,
             email=user_data.email,
-            senha_hash=hash_password(user_data.senha),
-            role=user_data.role
+            senha_hash=await hash_password_async(user_data.senha),
+            role=user_data.role,
+            permissoes_mask=mascara_role(user_data.role.value)
         )
         
         user_dict = user.dict()
@@ -205,6 +330,120 @@ async def criar_usuario_admin(
         logger.error(f"Erro ao criar usuário: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+LOTE_USUARIOS_MAXIMO = int(os.getenv("LOTE_USUARIOS_MAXIMO", "1000"))
+
+async def _ler_lote_usuarios(request: Request) -> List[dict]:
+    """Linhas do lote: CSV (cabeçalho nome,email,senha,role) ou JSON (lista ou {"usuarios": [...]})"""
+    corpo = await request.body()
+    content_type = request.headers.get('content-type', '')
+    
+    try:
+        texto = corpo.decode('utf-8-sig')
+        if 'csv' in content_type or 'text/plain' in content_type:
+            return [
+                {k.strip(): (v or '').strip() for k, v in linha.items() if k}
+                for linha in csv.DictReader(io.StringIO(texto))
+            ]
+        dados = json.loads(texto)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Corpo deve estar em UTF-8")
+    except (ValueError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Corpo deve ser CSV (text/csv) ou JSON válido: {str(e)}")
+    
+    if isinstance(dados, dict):
+        dados = dados.get('usuarios')
+    if not isinstance(dados, list):
+        raise HTTPException(status_code=400, detail="JSON deve ser uma lista de usuários")
+    return dados
+
+@api_router.post("/admin/users/lote")
+async def criar_usuarios_lote(request: Request, current_user: dict = Depends(get_current_user_dep)):
+    """
+    Cria vários usuários de uma vez (apenas admin)
+    
+    - Aceita CSV ou JSON com nome, email, senha e role (opcional)
+    - Emails duplicados (no lote ou já cadastrados) verificados numa só consulta
+    - Senhas com hash em paralelo no pool de processos; um único insert_many
+    - Linhas inválidas não impedem as demais: voltam em `erros` com o número da linha
+    """
+    await require_permission("admin", current_user)
+    
+    linhas = await _ler_lote_usuarios(request)
+    if len(linhas) > LOTE_USUARIOS_MAXIMO:
+        raise HTTPException(status_code=400, detail=f"Máximo de {LOTE_USUARIOS_MAXIMO} usuários por lote")
+    
+    try:
+        erros = []
+        validos = []
+        vistos = set()
+        for numero, linha in enumerate(linhas, start=1):
+            if not isinstance(linha, dict):
+                erros.append({"linha": numero, "erro": "Linha inválida"})
+                continue
+            if not linha.get('role'):
+                linha.pop('role', None)
+            try:
+                dados = UserCreate(**linha)
+            except ValidationError as e:
+                campos = ", ".join(str(erro['loc'][-1]) for erro in e.errors())
+                erros.append({"linha": numero, "email": linha.get('email'), "erro": f"Campos inválidos: {campos}"})
+                continue
+            
+            dados.email = dados.email.strip()
+            if not dados.email or not dados.senha:
+                erros.append({"linha": numero, "email": dados.email, "erro": "Email e senha são obrigatórios"})
+                continue
+            if dados.email in vistos:
+                erros.append({"linha": numero, "email": dados.email, "erro": "Email repetido no lote"})
+                continue
+            vistos.add(dados.email)
+            validos.append((numero, dados))
+        
+        # Uma consulta para todos os emails do lote
+        existentes = set()
+        if vistos:
+            async for user in db.users.find({"email": {"$in": list(vistos)}}, {"_id": 0, "email": 1}):
+                existentes.add(user['email'])
+        
+        novos = []
+        for numero, dados in validos:
+            if dados.email in existentes:
+                erros.append({"linha": numero, "email": dados.email, "erro": "Email já cadastrado"})
+            else:
+                novos.append(dados)
+        
+        user_ids = []
+        if novos:
+            hashes = await hash_passwords_lote([dados.senha for dados in novos])
+            documentos = []
+            for dados, senha_hash in zip(novos, hashes):
+                user = User(
+                    nome=dados.nome,
+                    email=dados.email,
+                    senha_hash=senha_hash,
+                    role=dados.role,
+                    permissoes_mask=mascara_role(dados.role.value)
+                )
+                user_dict = user.dict()
+                user_dict['created_at'] = user_dict['created_at'].isoformat()
+                documentos.append(user_dict)
+            
+            await db.users.insert_many(documentos)
+            user_ids = [documento['id'] for documento in documentos]
+        
+        erros.sort(key=lambda erro: erro['linha'])
+        return {
+            "message": f"{len(user_ids)} usuário(s) criado(s)",
+            "criados": len(user_ids),
+            "user_ids": user_ids,
+            "erros": erros
+        }
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Erro ao criar usuários em lote: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @api_router.put("/admin/users/{user_id}")
 async def atualizar_usuario(
     user_id: str,
@@ -223,13 +462,30 @@ async def atualizar_usuario(
         
         # Se alterando senha, fazer hash
         if 'senha' in update_data:
-            update_data['senha_hash'] = hash_password(update_data['senha'])
+            update_data['senha_hash'] = await hash_password_async(update_data['senha'])
             del update_data['senha']
         
         if 'role' in update_data:
             update_data['role'] = update_data['role'].value
         
-        await db.users.update_one({"id": user_id}, {"$set": update_data})
+        # Permissões são gravadas já compiladas
+        operacao = {}
+        if 'permissoes' in update_data:
+            try:
+                update_data['permissoes_mask'] = compilar_permissoes(update_data['permissoes'])
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            del update_data['permissoes']
+            operacao["$unset"] = {"permissoes": ""}
+        
+        operacao["$set"] = update_data
+        await db.users.update_one({"id": user_id}, operacao)
+        invalidar_usuario(user_id)
+        
+        # Troca de senha ou desativação encerra as sessões; demais alterações
+        # entram nas claims na próxima renovação do access token
+        if 'senha_hash' in update_data or update_data.get('ativo') is False:
+            await revogar_refresh_tokens(db, user_id)
         
         return {"message": "Usuário atualizado com sucesso"}
     except HTTPException as e:
@@ -247,34 +503,279 @@ async def excluir_usuario(
     await require_permission("admin", current_user)
     
     await db.users.delete_one({"id": user_id})
+    invalidar_usuario(user_id)
+    await revogar_refresh_tokens(db, user_id)
     return {"message": "Usuário excluído com sucesso"}
 
+@api_router.get("/admin/cache/usuarios")
+async def estatisticas_cache_usuarios(current_user: dict = Depends(get_current_user_dep)):
+    """Métricas do cache de usuários autenticados (apenas admin)"""
+    await require_permission("admin", current_user)
+    
+    return cache_usuarios.estatisticas()
+
+@api_router.get("/admin/cache/tokens")
+async def estatisticas_cache_tokens(current_user: dict = Depends(get_current_user_dep)):
+    """Métricas do cache de tokens JWT verificados (apenas admin)"""
+    await require_permission("admin", current_user)
+    
+    return cache_tokens.estatisticas()
+
+@api_router.get("/admin/cache/esteira")
+async def estatisticas_cache_esteira(current_user: dict = Depends(get_current_user_dep)):
+    """Métricas do cache da visualização da esteira (apenas admin)"""
+    await require_permission("admin", current_user)
+    
+    return cache_esteira.estatisticas()
+
+@api_router.post("/admin/cache/esteira/limpar")
+async def limpar_cache_esteira(current_user: dict = Depends(get_current_user_dep)):
+    """
+    Esvazia o cache da esteira (ex.: após importação direta no banco)
+    
+    Também avança as versões, para os navegadores não receberem 304 da
+    ETag antiga.
+    """
+    await require_permission("admin", current_user)
+    
+    cache_esteira.limpar()
+    await incrementar_versoes(db, "projetos", "contratos")
+    return {"message": "Cache da esteira limpo"}
+
+@api_router.get("/admin/coalescencia")
+async def estatisticas_coalescencia(current_user: dict = Depends(get_current_user_dep)):
+    """Execuções e requisições coalescidas por leitura cara (apenas admin)"""
+    await require_permission("admin", current_user)
+    
+    return [coalescedor.estatisticas() for coalescedor in COALESCEDORES.values()]
+
+@api_router.get("/admin/cache/invalidacao")
+async def estatisticas_invalidacao(current_user: dict = Depends(get_current_user_dep)):
+    """Estado do change stream que invalida os caches entre workers (apenas admin)"""
+    await require_permission("admin", current_user)
+    
+    return ouvinte_alteracoes.estatisticas()
+
+@api_router.get("/admin/limites/login")
+async def estatisticas_limite_login(current_user: dict = Depends(get_current_user_dep)):
+    """Tentativas de login permitidas/recusadas pelo limitador (apenas admin)"""
+    await require_permission("admin", current_user)
+    
+    return limitador_login.estatisticas()
+
+@api_router.get("/admin/api-keys")
+async def listar_api_keys(current_user: dict = Depends(get_current_user_dep)):
+    """Lista as API keys de integração, sem o digest (apenas admin)"""
+    await require_permission("admin", current_user)
+    
+    keys = await db.api_keys.find({}, {"_id": 0, "hash": 0}).to_list(1000)
+    for key in keys:
+        key['permissoes'] = [
+            nome for nome, ativa in expandir_permissoes(key['permissoes_mask']).items() if ativa
+        ]
+    return keys
+
+@api_router.post("/admin/api-keys")
+async def criar_api_key(dados: ApiKeyCreate, current_user: dict = Depends(get_current_user_dep)):
+    """
+    Cria API key com permissões restritas (apenas admin)
+    
+    A chave é retornada só nesta resposta; envie-a no header X-API-Key.
+    """
+    await require_permission("admin", current_user)
+    
+    try:
+        mascara = compilar_permissoes({nome: True for nome in dados.permissoes})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    registro, chave = await emitir_api_key(
+        db, dados.nome, mascara, current_user['id'], dados.expira_em_dias
+    )
+    return {
+        "id": registro['id'],
+        "nome": registro['nome'],
+        "prefixo": registro['prefixo'],
+        "permissoes": dados.permissoes,
+        "expira_em": registro['expira_em'],
+        "api_key": chave
+    }
+
+@api_router.delete("/admin/api-keys/{api_key_id}")
+async def revogar_api_key(api_key_id: str, current_user: dict = Depends(get_current_user_dep)):
+    """Revoga uma API key (apenas admin)"""
+    await require_permission("admin", current_user)
+    
+    result = await db.api_keys.update_one({"id": api_key_id}, {"$set": {"ativo": False}})
+    if result.matched_count == 0:
+        raise HTTPException(status_code=404, detail="API key não encontrada")
+    return {"message": "API key revogada com sucesso"}
+
+@api_router.post("/admin/notificacoes/recontar")
+async def recontar_notificacoes(
+    user_id: Optional[str] = None,
+    current_user: dict = Depends(get_current_user_dep)
+):
+    """Recalcula os contadores de não lidas a partir das notificações (apenas admin)"""
+    await require_permission("admin", current_user)
+    
+    resultado = await contador_notificacoes.recontar(user_id)
+    if user_id:
+        return {"user_id": user_id, "nao_lidas": resultado}
+    return {"usuarios_recalculados": resultado}
+
+@api_router.post("/admin/notificacoes/compactar")
+async def compactar_notificacoes(current_user: dict = Depends(get_current_user_dep)):
+    """Executa a compactação/retenção de notificações imediatamente (apenas admin)"""
+    await require_permission("admin", current_user)
+    
+    return await retencao_notificacoes.compactar()
+
+@api_router.post("/admin/notificacoes/migrar")
+async def migrar_notificacoes(current_user: dict = Depends(get_current_user_dep)):
+    """Migra notificações antigas para a caixa de entrada única (apenas admin)"""
+    await require_permission("admin", current_user)
+    
+    return await caixa_notificacoes.migrar()
+
+@api_router.get("/admin/tarefas/varredura-atrasos")
+async def estatisticas_varredura_atrasos(current_user: dict = Depends(get_current_user_dep)):
+    """Estatísticas da varredura periódica de tarefas atrasadas (apenas admin)"""
+    await require_permission("admin", current_user)
+    
+    return await varredura_atrasos.obter_estatisticas()
+
+@api_router.post("/admin/tarefas/varredura-atrasos")
+async def executar_varredura_atrasos(
+    completa: bool = False,
+    current_user: dict = Depends(get_current_user_dep)
+):
+    """Executa a varredura de tarefas atrasadas imediatamente (apenas admin)"""
+    await require_permission("admin", current_user)
+    
+    return await varredura_atrasos.executar(completa=completa)
+
 # ============ NOTIFICAÇÕES ============
+# Rotas fixas (/nao-lidas, /resumo, /ler-todas) precisam vir antes das rotas com parâmetro
+
+@api_router.get("/notificacoes")
+async def listar_notificacoes(
+    response: Response,
+    limite: int = CaixaNotificacoes.LIMITE_PADRAO,
+    cursor: Optional[str] = None,
+    apenas_nao_lidas: bool = False,
+    current_user: dict = Depends(get_current_user_dep)
+):
+    """
+    Lista as notificações do usuário logado (mais recentes primeiro)
+    - Paginação por cursor: o próximo cursor vem no header X-Proximo-Cursor
+    """
+    try:
+        notificacoes, proximo_cursor = await caixa_notificacoes.listar(
+            current_user['id'], limite, cursor, apenas_nao_lidas
+        )
+        if proximo_cursor:
+            response.headers["X-Proximo-Cursor"] = proximo_cursor
+        return notificacoes
+    except Exception as e:
+        logger.error(f"Erro ao listar notificações: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/notificacoes/nao-lidas")
+async def contar_nao_lidas(current_user: dict = Depends(get_current_user_dep)):
+    """Conta notificações não lidas do usuário"""
+    try:
+        count = await contador_notificacoes.obter(current_user['id'])
+        return {"count": count}
+    except Exception as e:
+        logger.error(f"Erro ao contar notificações: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/notificacoes/resumo")
+async def obter_resumo_notificacoes(current_user: dict = Depends(get_current_user_dep)):
+    """Resumo das notificações antigas arquivadas pela compactação"""
+    return await retencao_notificacoes.obter_resumo(current_user['id'])
+
+@api_router.put("/notificacoes/ler-todas")
+async def marcar_todas_como_lidas(current_user: dict = Depends(get_current_user_dep)):
+    """Marca todas as notificações do usuário como lidas"""
+    try:
+        await caixa_notificacoes.marcar_todas_lidas(current_user['id'])
+        return {"message": "Todas as notificações marcadas como lidas"}
+    except Exception as e:
+        logger.error(f"Erro ao marcar todas como lidas: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/notificacoes/{user_id}")
-async def obter_notificacoes(user_id: str):
+async def obter_notificacoes(
+    user_id: str,
+    limite: int = CaixaNotificacoes.LIMITE_MAXIMO,
+    cursor: Optional[str] = None
+):
     """Obtém notificações do usuário"""
-    notificacoes = await db.notificacoes_usuarios.find({"user_id": user_id}, {"_id": 0}).sort("created_at", -1).to_list(100)
+    notificacoes, _ = await caixa_notificacoes.listar(user_id, limite, cursor)
     return notificacoes
 
 @api_router.put("/notificacoes/{notificacao_id}/ler")
-async def marcar_notificacao_lida(notificacao_id: str):
-    """Marca notificação como lida"""
-    await db.notificacoes_usuarios.update_one(
-        {"id": notificacao_id},
-        {"$set": {"lida": True}}
-    )
-    return {"message": "Notificação marcada como lida"}
+async def marcar_como_lida(notificacao_id: str, current_user: dict = Depends(get_current_user_dep)):
+    """Marca uma notificação como lida"""
+    try:
+        marcada = await caixa_notificacoes.marcar_lida(notificacao_id, current_user['id'])
+        
+        if not marcada:
+            existe = await db.notificacoes_usuarios.find_one(
+                {"id": notificacao_id, "user_id": current_user['id']}, {"_id": 0, "id": 1}
+            )
+            if not existe:
+                raise HTTPException(status_code=404, detail="Notificação não encontrada")
+        
+        return {"message": "Notificação marcada como lida"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao marcar notificação como lida: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.put("/notificacoes/{user_id}/ler-todas")
 async def marcar_todas_lidas(user_id: str):
     """Marca todas as notificações como lidas"""
-    await db.notificacoes_usuarios.update_many(
-        {"user_id": user_id, "lida": False},
-        {"$set": {"lida": True}}
-    )
+    await caixa_notificacoes.marcar_todas_lidas(user_id)
     return {"message": "Todas as notificações marcadas como lidas"}
 
+# ============ CACHE HTTP (ETAG) ============
+
+async def verificar_etag(request: Request, response: Response, colecoes: List[str], *extra) -> Optional[Response]:
+    """
+    ETag das listagens consultadas em polling
+    
+    Retorna um 304 pronto se o cliente já tem a versão atual; senão grava
+    a ETag na resposta e retorna None. A versão é lida antes dos dados, de
+    modo que uma escrita concorrente nunca fica escondida atrás de uma
+    ETag antiga.
+    """
+    etag = await etag_versoes(db, colecoes, *extra)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_corresponde(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+# ============ SINCRONIZAÇÃO INCREMENTAL ============
+
+@api_router.get("/sync")
+async def sincronizar(since: int = 0):
+    """
+    Contratos, projetos e tarefas alterados desde o cursor `since`
+    
+    - Toda escrita grava `updated_at` e `seq` (sequência global monotônica)
+    - Resposta: registros alterados, ids excluídos por coleção e o novo `cursor`
+    - Paginado por `seq`: com `mais: true`, repetir com since=cursor
+    - since=0 ou cursor muito antigo: `completo: true`, recomeça do zero
+    - Clientes de longa duração devem refazer o sync completo periodicamente
+      (ver SYNC_RESERVA_SEGUNDOS)
+    """
+    return resposta_json(await alteracoes_desde(db, since))
+
 # ============ CONTRATOS ============
 
 @api_router.post("/contratos", response_model=OperacaoResponse)
@@ -308,6 +809,7 @@ async def criar_contrato(contrato_input: ContratoCreate):
         for log_item in contrato_dict['logs']:
             log_item['timestamp'] = log_item['timestamp'].isoformat()
         
+        contrato_dict.update(await carimbo_alteracao(db))
         await db.contratos.insert_one(contrato_dict)
         
         # Criar projeto vinculado
@@ -326,12 +828,13 @@ async def criar_contrato(contrato_input: ContratoCreate):
         projeto_dict['created_at'] = projeto_dict['created_at'].isoformat()
         projeto_dict['logs'] = []
         
+        projeto_dict.update(await carimbo_alteracao(db))
         await db.projetos.insert_one(projeto_dict)
         
         # Atualizar contrato com projeto_id
         await db.contratos.update_one(
             {"id": contrato.id},
-            {"$set": {"projeto_id": projeto.id}}
+            {"$set": {"projeto_id": projeto.id, **await carimbo_alteracao(db)}}
         )
         
         # GERAR APENAS TAREFAS DA PRIMEIRA ETAPA (Lançamento)
@@ -345,6 +848,8 @@ async def criar_contrato(contrato_input: ContratoCreate):
         for tarefa in tarefas_criadas:
             await gerador_notificacoes.notificar_tarefa_atribuida(tarefa)
         
+        await incrementar_versoes(db, "contratos", "projetos", "tarefas")
+        
         logger.info(f"Contrato {contrato.id} criado com sucesso - {len(tarefas_criadas)} tarefas geradas")
         
         return OperacaoResponse(
@@ -377,10 +882,14 @@ async def criar_contrato(contrato_input: ContratoCreate):
         )
 
 @api_router.get("/contratos")
-async def listar_contratos():
+async def listar_contratos(request: Request, response: Response):
     """Lista todos os contratos"""
+    nao_modificado = await verificar_etag(request, response, ["contratos"])
+    if nao_modificado:
+        return nao_modificado
+    
     contratos = await db.contratos.find({}, {"_id": 0}).to_list(1000)
-    return contratos
+    return resposta_json(contratos, response)
 
 @api_router.get("/contratos/{contrato_id}")
 async def obter_contrato(contrato_id: str):
@@ -437,9 +946,11 @@ async def atualizar_contrato(contrato_id: str, update: ContratoUpdate):
         
         await db.contratos.update_one(
             {"id": contrato_id},
-            {"$set": update_data}
+            {"$set": {**update_data, **await carimbo_alteracao(db)}}
         )
         
+        await incrementar_versoes(db, "contratos", "tarefas")
+        
         logger.info(f"Contrato {contrato_id} atualizado")
         
         return OperacaoResponse(
@@ -489,12 +1000,13 @@ async def aprovar_contrato(contrato_id: str):
         # Atualizar status do contrato
         await db.contratos.update_one(
             {"id": contrato_id},
-            {"$set": {"status": ContratoStatus.EM_ANDAMENTO.value}}
+            {"$set": {"status": ContratoStatus.EM_ANDAMENTO.value, **await carimbo_alteracao(db)}}
         )
         
         # Buscar projeto vinculado
         projeto_id = contrato.get('projeto_id')
         if not projeto_id:
+            await incrementar_versoes(db, "contratos")
             return OperacaoResponse(
                 status="error",
                 acao_executada="aprovar_contrato",
@@ -508,6 +1020,7 @@ async def aprovar_contrato(contrato_id: str):
             await db.projetos.update_one(
                 {"id": projeto_id},
                 {"$set": {
+                    **await carimbo_alteracao(db),
                     "etapa_atual": EtapaProjeto.ATIVACAO.value,
                     "macro_etapa": MacroEtapa.ATENDIMENTO.value
                 }}
@@ -525,6 +1038,8 @@ async def aprovar_contrato(contrato_id: str):
             for tarefa in tarefas_criadas:
                 await gerador_notificacoes.notificar_tarefa_atribuida(tarefa)
         
+        await incrementar_versoes(db, "contratos", "projetos", "tarefas")
+        
         logger.info(f"Contrato {contrato_id} aprovado - {len(tarefas_criadas) if 'tarefas_criadas' in locals() else 0} tarefas geradas")
         
         return OperacaoResponse(
@@ -588,6 +1103,7 @@ async def finalizar_contrato(contrato_id: str):
             await db.projetos.update_one(
                 {"id": projeto_id},
                 {"$set": {
+                    **await carimbo_alteracao(db),
                     "etapa_atual": EtapaProjeto.ENCERRADO.value,
                     "macro_etapa": MacroEtapa.POS_VENDAS.value,
                     "progresso": 100.0
@@ -597,9 +1113,11 @@ async def finalizar_contrato(contrato_id: str):
         # Atualizar status do contrato
         await db.contratos.update_one(
             {"id": contrato_id},
-            {"$set": {"status": ContratoStatus.FINALIZADO.value}}
+            {"$set": {"status": ContratoStatus.FINALIZADO.value, **await carimbo_alteracao(db)}}
         )
         
+        await incrementar_versoes(db, "contratos", "projetos")
+        
         logger.info(f"Contrato {contrato_id} finalizado")
         
         return OperacaoResponse(
@@ -664,12 +1182,19 @@ async def excluir_contrato(contrato_id: str):
                         motivo=f"BLOQUEIO ABSOLUTO: Projeto está na etapa '{etapa_atual}'. Exclusão não permitida após início da produção."
                     )
         
-        # Exclusão em cascata
+        # Exclusão em cascata (com marcas de exclusão para o sync)
+        carimbo = await carimbo_alteracao(db)
         if projeto_id:
+            tarefas_ids = await db.tarefas.distinct("id", {"projeto_id": projeto_id})
             await db.tarefas.delete_many({"projeto_id": projeto_id})
             await db.projetos.delete_one({"id": projeto_id})
+            await registrar_exclusoes(db, "tarefas", tarefas_ids, carimbo)
+            await registrar_exclusoes(db, "projetos", [projeto_id], carimbo)
         
         await db.contratos.delete_one({"id": contrato_id})
+        await registrar_exclusoes(db, "contratos", [contrato_id], carimbo)
+        
+        await incrementar_versoes(db, "contratos", "projetos", "tarefas")
         
         logger.info(f"Contrato {contrato_id} excluído")
         
@@ -695,8 +1220,12 @@ async def excluir_contrato(contrato_id: str):
 # ============ PROJETOS ============
 
 @api_router.get("/projetos")
-async def listar_projetos():
+async def listar_projetos(request: Request, response: Response):
     """Lista todos os projetos com informações do contrato"""
+    nao_modificado = await verificar_etag(request, response, ["projetos", "contratos"])
+    if nao_modificado:
+        return nao_modificado
+    
     projetos = await db.projetos.find({}, {"_id": 0}).to_list(1000)
     
     # Enriquecer projetos com dados do contrato
@@ -722,7 +1251,7 @@ async def listar_projetos():
         if 'contrato_numero' not in projeto:
             projeto['contrato_numero'] = 'N/A'
     
-    return projetos
+    return resposta_json(projetos, response)
 
 @api_router.get("/projetos/{projeto_id}")
 async def obter_projeto(projeto_id: str):
@@ -768,7 +1297,7 @@ async def atualizar_projeto(projeto_id: str, update: ProjetoUpdate):
             if update.etapa_atual == EtapaProjeto.PRODUCAO:
                 await db.contratos.update_one(
                     {"id": projeto.contrato_id},
-                    {"$set": {"status": ContratoStatus.EM_PRODUCAO.value}}
+                    {"$set": {"status": ContratoStatus.EM_PRODUCAO.value, **await carimbo_alteracao(db)}}
                 )
         
         update_data = {k: v.value if hasattr(v, 'value') else v for k, v in update.dict().items() if v is not None}
@@ -783,9 +1312,11 @@ async def atualizar_projeto(projeto_id: str, update: ProjetoUpdate):
         
         await db.projetos.update_one(
             {"id": projeto_id},
-            {"$set": update_data}
+            {"$set": {**update_data, **await carimbo_alteracao(db)}}
         )
         
+        await incrementar_versoes(db, "projetos", "contratos")
+        
         logger.info(f"Projeto {projeto_id} atualizado")
         
         return OperacaoResponse(
@@ -811,65 +1342,88 @@ async def atualizar_projeto(projeto_id: str, update: ProjetoUpdate):
             motivo=f"Erro: {str(e)}"
         )
 
+@coalescer("esteira")
+async def montar_esteira(etag: str) -> dict:
+    """
+    Carrega projetos e contratos e distribui nas colunas da esteira
+    
+    Requisições simultâneas com a mesma ETag compartilham uma única montagem,
+    que fica no cache_esteira.
+    """
+    projetos = await db.projetos.find({}, {"_id": 0}).to_list(1000)
+    contratos = await db.contratos.find({}, {"_id": 0}).to_list(1000)
+    
+    # Mapear contratos por ID
+    contratos_map = {c['id']: c for c in contratos}
+    
+    # Organizar por macro etapa
+    esteira = {
+        "PRE_PRODUCAO": {
+            "titulo": "Pré-Produção",
+            "cor": "#3b82f6",
+            "projetos": []
+        },
+        "PRODUCAO": {
+            "titulo": "Produção",
+            "cor": "#f59e0b",
+            "projetos": []
+        },
+        "POS_PRODUCAO": {
+            "titulo": "Pós-Produção",
+            "cor": "#10b981",
+            "projetos": []
+        }
+    }
+    
+    for projeto in projetos:
+        # Enriquecer dados do projeto
+        contrato = contratos_map.get(projeto.get('contrato_id'), {})
+        
+        projeto_info = {
+            **projeto,
+            "cliente": contrato.get('cliente', 'Cliente'),
+            "faculdade": contrato.get('faculdade', ''),
+            "numero_contrato": contrato.get('numero_contrato', 0),
+            "valor": contrato.get('valor', 0)
+        }
+        
+        # Determinar coluna baseado na macro etapa
+        macro = projeto.get('macro_etapa', MacroEtapa.ATENDIMENTO.value)
+        
+        if macro in [MacroEtapa.ATENDIMENTO.value, MacroEtapa.CLIENTE.value, MacroEtapa.PREPARACAO.value, MacroEtapa.CRIACAO.value, MacroEtapa.PRE_PRODUCAO.value]:
+            esteira["PRE_PRODUCAO"]["projetos"].append(projeto_info)
+        elif macro == MacroEtapa.PRODUCAO.value:
+            esteira["PRODUCAO"]["projetos"].append(projeto_info)
+        elif macro == MacroEtapa.POS_VENDAS.value:
+            esteira["POS_PRODUCAO"]["projetos"].append(projeto_info)
+        else:
+            # Default para pré-produção
+            esteira["PRE_PRODUCAO"]["projetos"].append(projeto_info)
+    
+    cache_esteira.definir(etag, esteira)
+    return esteira
+
 @api_router.get("/projetos/esteira/visualizacao")
-async def visualizar_esteira():
+async def visualizar_esteira(request: Request, response: Response):
     """
     VISUALIZAÇÃO DA ESTEIRA
     - Organiza projetos por macro etapa
     - Retorna estrutura para visualização em colunas
+    - ETag: 304 se projetos e contratos não mudaram
+    - Resposta em cache por ETag, invalidada pelas escritas em projetos/contratos
     """
     try:
-        projetos = await db.projetos.find({}, {"_id": 0}).to_list(1000)
-        contratos = await db.contratos.find({}, {"_id": 0}).to_list(1000)
-        
-        # Mapear contratos por ID
-        contratos_map = {c['id']: c for c in contratos}
+        nao_modificado = await verificar_etag(request, response, ["projetos", "contratos"])
+        if nao_modificado:
+            return nao_modificado
         
-        # Organizar por macro etapa
-        esteira = {
-            "PRE_PRODUCAO": {
-                "titulo": "Pré-Produção",
-                "cor": "#3b82f6",
-                "projetos": []
-            },
-            "PRODUCAO": {
-                "titulo": "Produção",
-                "cor": "#f59e0b",
-                "projetos": []
-            },
-            "POS_PRODUCAO": {
-                "titulo": "Pós-Produção",
-                "cor": "#10b981",
-                "projetos": []
-            }
-        }
+        etag = response.headers["etag"]
+        esteira = cache_esteira.obter(etag)
+        if esteira is not None:
+            return resposta_json(esteira, response)
         
-        for projeto in projetos:
-            # Enriquecer dados do projeto
-            contrato = contratos_map.get(projeto.get('contrato_id'), {})
-            
-            projeto_info = {
-                **projeto,
-                "cliente": contrato.get('cliente', 'Cliente'),
-                "faculdade": contrato.get('faculdade', ''),
-                "numero_contrato": contrato.get('numero_contrato', 0),
-                "valor": contrato.get('valor', 0)
-            }
-            
-            # Determinar coluna baseado na macro etapa
-            macro = projeto.get('macro_etapa', MacroEtapa.ATENDIMENTO.value)
-            
-            if macro in [MacroEtapa.ATENDIMENTO.value, MacroEtapa.CLIENTE.value, MacroEtapa.PREPARACAO.value, MacroEtapa.CRIACAO.value, MacroEtapa.PRE_PRODUCAO.value]:
-                esteira["PRE_PRODUCAO"]["projetos"].append(projeto_info)
-            elif macro == MacroEtapa.PRODUCAO.value:
-                esteira["PRODUCAO"]["projetos"].append(projeto_info)
-            elif macro == MacroEtapa.POS_VENDAS.value:
-                esteira["POS_PRODUCAO"]["projetos"].append(projeto_info)
-            else:
-                # Default para pré-produção
-                esteira["PRE_PRODUCAO"]["projetos"].append(projeto_info)
-        
-        return esteira
+        esteira = await montar_esteira(etag)
+        return resposta_json(esteira, response)
     
     except Exception as e:
         logger.error(f"Erro ao visualizar esteira: {str(e)}")
@@ -906,13 +1460,13 @@ async def finalizar_projeto(projeto_id: str):
         # Atualizar projeto
         await db.projetos.update_one(
             {"id": projeto_id},
-            {"$set": {"progresso": 100.0, "risco": NivelRisco.BAIXO.value}}
+            {"$set": {"progresso": 100.0, "risco": NivelRisco.BAIXO.value, **await carimbo_alteracao(db)}}
         )
         
         # Atualizar contrato
         await db.contratos.update_one(
             {"id": projeto.get('contrato_id')},
-            {"$set": {"status": ContratoStatus.ENTREGUE.value}}
+            {"$set": {"status": ContratoStatus.ENTREGUE.value, **await carimbo_alteracao(db)}}
         )
         
         # Criar notificação de conclusão
@@ -924,6 +1478,8 @@ async def finalizar_projeto(projeto_id: str):
             tipo="projeto_entregue"
         )
         
+        await incrementar_versoes(db, "projetos", "contratos")
+        
         logger.info(f"Projeto {projeto_id} finalizado")
         
         return OperacaoResponse(
@@ -1027,7 +1583,7 @@ async def avancar_macro_etapa(projeto_id: str):
         
         await db.projetos.update_one(
             {"id": projeto_id},
-            {"$set": update_data}
+            {"$set": {**update_data, **await carimbo_alteracao(db)}}
         )
         
         # Gerar tarefas da nova etapa se houver etapa específica
@@ -1050,9 +1606,11 @@ async def avancar_macro_etapa(projeto_id: str):
             if contrato:
                 await db.contratos.update_one(
                     {"id": contrato['id']},
-                    {"$set": {"status": ContratoStatus.EM_ANDAMENTO.value}}
+                    {"$set": {"status": ContratoStatus.EM_ANDAMENTO.value, **await carimbo_alteracao(db)}}
                 )
         
+        await incrementar_versoes(db, "projetos", "contratos", "tarefas")
+        
         logger.info(f"Projeto {projeto_id} avançou de {macro_atual} para {proxima_macro}")
         
         return OperacaoResponse(
@@ -1135,6 +1693,7 @@ async def avancar_etapa_projeto(projeto_id: str):
         await db.projetos.update_one(
             {"id": projeto_id},
             {"$set": {
+                **await carimbo_alteracao(db),
                 "etapa_atual": proxima_etapa.value,
                 "macro_etapa": macro.value
             }}
@@ -1152,6 +1711,8 @@ async def avancar_etapa_projeto(projeto_id: str):
         for tarefa in tarefas_criadas:
             await gerador_notificacoes.notificar_tarefa_atribuida(tarefa)
         
+        await incrementar_versoes(db, "projetos", "tarefas")
+        
         logger.info(f"Projeto {projeto_id} avançou para {proxima_etapa.value} - {len(tarefas_criadas)} novas tarefas")
         
         return OperacaoResponse(
@@ -1224,6 +1785,7 @@ async def criar_tarefa(tarefa_input: TarefaCreate):
         tarefa_dict['prazo'] = tarefa_dict['prazo'].isoformat()
         tarefa_dict['created_at'] = tarefa_dict['created_at'].isoformat()
         
+        tarefa_dict.update(await carimbo_alteracao(db))
         await db.tarefas.insert_one(tarefa_dict)
         
         # Criar notificação
@@ -1234,6 +1796,8 @@ async def criar_tarefa(tarefa_input: TarefaCreate):
             tipo="atribuicao"
         )
         
+        await incrementar_versoes(db, "tarefas")
+        
         logger.info(f"Tarefa {tarefa.id} criada")
         
         return OperacaoResponse(
@@ -1257,8 +1821,17 @@ async def criar_tarefa(tarefa_input: TarefaCreate):
         )
 
 @api_router.get("/tarefas")
-async def listar_tarefas(projeto_id: Optional[str] = None, etapa: Optional[str] = None):
+async def listar_tarefas(
+    request: Request,
+    response: Response,
+    projeto_id: Optional[str] = None,
+    etapa: Optional[str] = None
+):
     """Lista tarefas com filtros opcionais"""
+    nao_modificado = await verificar_etag(request, response, ["tarefas"], projeto_id, etapa)
+    if nao_modificado:
+        return nao_modificado
+    
     query = {}
     if projeto_id:
         query['projeto_id'] = projeto_id
@@ -1276,7 +1849,7 @@ async def listar_tarefas(projeto_id: Optional[str] = None, etapa: Optional[str]
             tarefa['atividade'] = tarefa.get('titulo', 'Atividade')
         if 'setor' not in tarefa:
             tarefa['setor'] = 'Geral'
-    return tarefas
+    return resposta_json(tarefas, response)
 
 @api_router.get("/tarefas/{tarefa_id}")
 async def obter_tarefa(tarefa_id: str):
@@ -1334,7 +1907,7 @@ async def atualizar_tarefa(tarefa_id: str, update: TarefaUpdate):
         
         await db.tarefas.update_one(
             {"id": tarefa_id},
-            {"$set": update_data}
+            {"$set": {**update_data, **await carimbo_alteracao(db)}}
         )
         
         # Atualizar progresso do projeto
@@ -1343,9 +1916,11 @@ async def atualizar_tarefa(tarefa_id: str, update: TarefaUpdate):
         
         await db.projetos.update_one(
             {"id": tarefa.projeto_id},
-            {"$set": {"progresso": progresso, "risco": risco.value}}
+            {"$set": {"progresso": progresso, "risco": risco.value, **await carimbo_alteracao(db)}}
         )
         
+        await incrementar_versoes(db, "tarefas", "projetos")
+        
         logger.info(f"Tarefa {tarefa_id} atualizada")
         
         return OperacaoResponse(
@@ -1407,6 +1982,7 @@ async def mover_tarefa(tarefa_id: str, nova_etapa: str):
         await db.tarefas.update_one(
             {"id": tarefa_id},
             {"$set": {
+                **await carimbo_alteracao(db),
                 "etapa": nova_etapa_enum.value,
                 "macro_etapa": nova_macro.value,
                 "status": TarefaStatus.EM_ANDAMENTO.value if nova_etapa != etapa_atual else tarefa.get('status')
@@ -1418,9 +1994,11 @@ async def mover_tarefa(tarefa_id: str, nova_etapa: str):
         progresso = await workflow_engine.calcular_progresso_projeto(projeto_id)
         await db.projetos.update_one(
             {"id": projeto_id},
-            {"$set": {"progresso": progresso}}
+            {"$set": {"progresso": progresso, **await carimbo_alteracao(db)}}
         )
         
+        await incrementar_versoes(db, "tarefas", "projetos")
+        
         logger.info(f"Tarefa {tarefa_id} movida de {etapa_atual} para {nova_etapa_enum.value}")
         
         return OperacaoResponse(
@@ -1466,6 +2044,9 @@ async def excluir_tarefa(tarefa_id: str):
             )
         
         await db.tarefas.delete_one({"id": tarefa_id})
+        await registrar_exclusoes(db, "tarefas", [tarefa_id], await carimbo_alteracao(db))
+        
+        await incrementar_versoes(db, "tarefas")
         
         logger.info(f"Tarefa {tarefa_id} excluída")
         
@@ -1491,115 +2072,87 @@ async def excluir_tarefa(tarefa_id: str):
 # ============ ALERTAS E MONITORAMENTO ============
 
 @api_router.get("/tarefas/kanban/{projeto_id}")
-async def visualizar_kanban(projeto_id: str):
+async def visualizar_kanban(projeto_id: str, request: Request, response: Response):
     """
     VISUALIZAÇÃO KANBAN (Estilo Trello)
     - Organiza tarefas por etapa em colunas
     - Permite drag and drop entre colunas
+    - ETag: 304 se as tarefas não mudaram
     """
     try:
+        nao_modificado = await verificar_etag(request, response, ["tarefas"], projeto_id)
+        if nao_modificado:
+            return nao_modificado
+        
         tarefas = await db.tarefas.find({"projeto_id": projeto_id}, {"_id": 0}).to_list(1000)
+        kanban = montar_kanban(tarefas)
         
-        # Definir colunas do Kanban (etapas principais)
-        kanban = {
-            "LANCAMENTO": {
-                "titulo": "Lançamento",
-                "cor": "#6366f1",
-                "tarefas": []
-            },
-            "ATIVACAO": {
-                "titulo": "Ativação",
-                "cor": "#8b5cf6",
-                "tarefas": []
-            },
-            "REVISAO": {
-                "titulo": "Revisão/Preparação",
-                "cor": "#ec4899",
-                "tarefas": []
-            },
-            "CRIACAO_1_2": {
-                "titulo": "Criação (1ª/2ª)",
-                "cor": "#f59e0b",
-                "tarefas": []
-            },
-            "CRIACAO_3_4": {
-                "titulo": "Criação (3ª/4ª)",
-                "cor": "#f97316",
-                "tarefas": []
-            },
-            "APROVACAO": {
-                "titulo": "Aprovação Final",
-                "cor": "#10b981",
-                "tarefas": []
-            },
-            "PLANEJAMENTO": {
-                "titulo": "Planejamento",
-                "cor": "#3b82f6",
-                "tarefas": []
-            },
-            "PRE_PRODUCAO": {
-                "titulo": "Pré-Produção",
-                "cor": "#06b6d4",
-                "tarefas": []
-            },
-            "PRODUCAO": {
-                "titulo": "Produção",
-                "cor": "#14b8a6",
-                "tarefas": []
-            },
-            "CONCLUIDO": {
-                "titulo": "Concluído",
-                "cor": "#22c55e",
-                "tarefas": []
-            }
-        }
+        return resposta_json(kanban, response)
+    
+    except Exception as e:
+        logger.error(f"Erro ao visualizar kanban: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/quadro")
+async def obter_quadro(projeto_id: Optional[str] = None):
+    """
+    QUADRO DE TAREFAS (uma requisição para a tela do Kanban)
+    - Lista leve de projetos para o seletor (sem N+1 de contratos)
+    - Kanban do projeto selecionado (ou do primeiro, se não informado)
+    - Progresso e risco calculados sobre as tarefas já carregadas
+    - 404 se o projeto informado não existe
+    Consultas independentes rodam em paralelo com asyncio.gather
+    """
+    try:
+        async def tarefas_e_projeto(pid: str):
+            return await asyncio.gather(
+                db.tarefas.find({"projeto_id": pid}, {"_id": 0}).to_list(1000),
+                db.projetos.find_one({"id": pid}, {"_id": 0})
+            )
         
-        for tarefa in tarefas:
-            # Adicionar campos padrão
-            if 'macro_etapa' not in tarefa:
-                tarefa['macro_etapa'] = MacroEtapa.ATENDIMENTO.value
-            if 'numero' not in tarefa:
-                tarefa['numero'] = 0
-            if 'atividade' not in tarefa:
-                tarefa['atividade'] = tarefa.get('titulo', 'Atividade')
-            if 'setor' not in tarefa:
-                tarefa['setor'] = 'Geral'
-            
-            etapa = tarefa.get('etapa', '')
-            
-            # Mapear para colunas do Kanban
-            if EtapaProjeto.LANCAMENTO.value in etapa:
-                kanban["LANCAMENTO"]["tarefas"].append(tarefa)
-            elif EtapaProjeto.ATIVACAO.value in etapa:
-                kanban["ATIVACAO"]["tarefas"].append(tarefa)
-            elif EtapaProjeto.REVISAO_TEXTO.value in etapa:
-                kanban["REVISAO"]["tarefas"].append(tarefa)
-            elif EtapaProjeto.CRIACAO_1_2.value in etapa or EtapaProjeto.CONFERENCIA.value in etapa or EtapaProjeto.AJUSTE_LAYOUT.value in etapa:
-                kanban["CRIACAO_1_2"]["tarefas"].append(tarefa)
-            elif EtapaProjeto.CRIACAO_3_4.value in etapa:
-                kanban["CRIACAO_3_4"]["tarefas"].append(tarefa)
-            elif EtapaProjeto.APROVACAO_FINAL.value in etapa:
-                kanban["APROVACAO"]["tarefas"].append(tarefa)
-            elif EtapaProjeto.PLANEJAMENTO_PRODUCAO.value in etapa:
-                kanban["PLANEJAMENTO"]["tarefas"].append(tarefa)
-            elif EtapaProjeto.PRE_PRODUCAO.value in etapa:
-                kanban["PRE_PRODUCAO"]["tarefas"].append(tarefa)
-            elif etapa in [EtapaProjeto.PRODUCAO.value, EtapaProjeto.QUALIDADE.value, EtapaProjeto.ENTREGA.value]:
-                if tarefa.get('status') == TarefaStatus.CONCLUIDO.value:
-                    kanban["CONCLUIDO"]["tarefas"].append(tarefa)
-                else:
-                    kanban["PRODUCAO"]["tarefas"].append(tarefa)
-            else:
-                # Tarefas concluídas vão para a coluna final
-                if tarefa.get('status') == TarefaStatus.CONCLUIDO.value:
-                    kanban["CONCLUIDO"]["tarefas"].append(tarefa)
-                else:
-                    kanban["LANCAMENTO"]["tarefas"].append(tarefa)
+        consultas = [
+            db.projetos.find({}, {"_id": 0, "id": 1, "contrato_id": 1, "macro_etapa": 1}).to_list(1000),
+            db.contratos.find({}, {"_id": 0, "id": 1, "cliente": 1, "numero_contrato": 1}).to_list(1000)
+        ]
+        if projeto_id:
+            consultas.append(tarefas_e_projeto(projeto_id))
+        resultados = await asyncio.gather(*consultas)
+        projetos, contratos = resultados[0], resultados[1]
+        
+        contratos_map = {c['id']: c for c in contratos}
+        seletor = []
+        for projeto in projetos:
+            contrato = contratos_map.get(projeto.get('contrato_id'), {})
+            seletor.append({
+                "id": projeto['id'],
+                "cliente": contrato.get('cliente', 'N/A'),
+                "numero_contrato": contrato.get('numero_contrato'),
+                "macro_etapa": projeto.get('macro_etapa', MacroEtapa.ATENDIMENTO.value)
+            })
         
-        return kanban
+        if projeto_id:
+            tarefas, projeto = resultados[2]
+        elif seletor:
+            projeto_id = seletor[0]['id']
+            tarefas, projeto = await tarefas_e_projeto(projeto_id)
+        else:
+            return resposta_json({"projetos": [], "projeto_id": None, "kanban": None, "progresso": 0.0, "risco": None})
+        
+        if not projeto:
+            raise HTTPException(status_code=404, detail="Projeto não encontrado")
+        
+        return resposta_json({
+            "projetos": seletor,
+            "projeto_id": projeto_id,
+            "kanban": montar_kanban(tarefas),
+            "progresso": WorkflowEngine.calcular_progresso(tarefas),
+            "risco": WorkflowEngine.classificar_risco(tarefas, projeto).value
+        })
     
+    except HTTPException as e:
+        raise e
     except Exception as e:
-        logger.error(f"Erro ao visualizar kanban: {str(e)}")
+        logger.error(f"Erro ao montar quadro: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/alertas/{projeto_id}", response_model=List[Alerta])
@@ -1609,6 +2162,7 @@ async def obter_alertas(projeto_id: str):
     return alertas
 
 @api_router.get("/dashboard")
+@coalescer("dashboard")
 async def obter_dashboard():
     """
     DASHBOARD GERENCIAL
@@ -1616,6 +2170,7 @@ async def obter_dashboard():
     - Projetos em risco
     - Tarefas atrasadas
     - Gargalos
+    - Chamadas simultâneas compartilham um único cálculo (single-flight)
     """
     try:
         # Total de projetos
@@ -1705,67 +2260,6 @@ async def root():
     }
 
 
-# ============ NOTIFICAÇÕES ============
-
-@api_router.get("/notificacoes")
-async def listar_notificacoes(current_user: dict = Depends(get_current_user_dep)):
-    """Lista todas as notificações do usuário logado"""
-    try:
-        notificacoes = await db.notificacoes.find(
-            {"usuario_id": current_user['id']},
-            {"_id": 0}
-        ).sort("created_at", -1).to_list(100)
-        
-        return notificacoes
-    except Exception as e:
-        logger.error(f"Erro ao listar notificações: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@api_router.get("/notificacoes/nao-lidas")
-async def contar_nao_lidas(current_user: dict = Depends(get_current_user_dep)):
-    """Conta notificações não lidas do usuário"""
-    try:
-        count = await db.notificacoes.count_documents({
-            "usuario_id": current_user['id'],
-            "lida": False
-        })
-        return {"count": count}
-    except Exception as e:
-        logger.error(f"Erro ao contar notificações: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@api_router.put("/notificacoes/{notificacao_id}/ler")
-async def marcar_como_lida(notificacao_id: str, current_user: dict = Depends(get_current_user_dep)):
-    """Marca uma notificação como lida"""
-    try:
-        result = await db.notificacoes.update_one(
-            {"id": notificacao_id, "usuario_id": current_user['id']},
-            {"$set": {"lida": True}}
-        )
-        
-        if result.modified_count == 0:
-            raise HTTPException(status_code=404, detail="Notificação não encontrada")
-        
-        return {"message": "Notificação marcada como lida"}
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Erro ao marcar notificação como lida: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-@api_router.put("/notificacoes/ler-todas")
-async def marcar_todas_como_lidas(current_user: dict = Depends(get_current_user_dep)):
-    """Marca todas as notificações do usuário como lidas"""
-    try:
-        await db.notificacoes.update_many(
-            {"usuario_id": current_user['id'], "lida": False},
-            {"$set": {"lida": True}}
-        )
-        return {"message": "Todas as notificações marcadas como lidas"}
-    except Exception as e:
-        logger.error(f"Erro ao marcar todas como lidas: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
-
 # ============ DASHBOARD E ESTATÍSTICAS ============
 
 @api_router.get("/dashboard/tarefas-atrasadas")
@@ -1827,6 +2321,25 @@ async def tarefas_proximas_vencer(current_user: dict = Depends(get_current_user_
 # Include the router in the main app
 app.include_router(api_router)
 
+@app.get("/metrics", include_in_schema=False)
+async def exportar_metricas(request: Request):
+    """Métricas por rota no formato texto do Prometheus (fora do /api: coletado direto no backend)"""
+    if not metricas_autorizado(request.headers.get("authorization")):
+        raise HTTPException(status_code=401, detail="Token de métricas inválido")
+    return PlainTextResponse(registro_metricas.exportar(), media_type="text/plain; version=0.0.4")
+
+app.add_middleware(
+    CompressaoMiddleware,
+    niveis_por_rota={
+        # Listagens grandes e repetitivas: brotli mais alto ainda reduz bytes
+        # (gzip acima de 6 quase não ganha e custa 3x CPU; ver benchmarks/bench_compressao.py)
+        "/api/projetos/esteira": {"br": 5},
+        "/api/tarefas/kanban": {"br": 5},
+        # Polling frequente de respostas pequenas: nível mais barato
+        "/api/notificacoes": {"gzip": 1, "br": 1},
+    }
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -1835,6 +2348,64 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if MONGO_INSTRUMENTACAO_ATIVA:
+    app.add_middleware(InstrumentacaoMongoMiddleware)
+
+# Por último = mais externo: mede também CORS e compressão, e os bytes enviados
+app.add_middleware(MetricasMiddleware)
+
+# ============ TAREFAS PERIÓDICAS ============
+
+tarefas_periodicas: List[asyncio.Task] = []
+
+async def executar_periodicamente(nome: str, intervalo: int, funcao):
+    """Executa `funcao` a cada `intervalo` segundos até o shutdown"""
+    while True:
+        await asyncio.sleep(intervalo)
+        try:
+            await funcao()
+        except Exception as e:
+            logger.error(f"Erro na tarefa periódica {nome}: {str(e)}")
+
+@app.on_event("startup")
+async def criar_indices():
+    await criar_indices_auth(db)
+    await migrar_permissoes_usuarios(db)
+    await limitador_login.criar_indices()
+    await criar_indices_api_keys(db)
+    await contador_notificacoes.criar_indices()
+    await caixa_notificacoes.criar_indices()
+    await caixa_notificacoes.migrar()
+    await retencao_notificacoes.criar_indices()
+    await varredura_atrasos.criar_indices()
+    await criar_indices_sync(db)
+    if await preencher_campos_tarefas(db):
+        await incrementar_versoes(db, "tarefas")
+
+@app.on_event("startup")
+async def iniciar_tarefas_periodicas():
+    tarefas_periodicas.append(asyncio.create_task(
+        executar_periodicamente("compactacao_notificacoes", COMPACTACAO_INTERVALO_SEGUNDOS, retencao_notificacoes.compactar)
+    ))
+    tarefas_periodicas.append(asyncio.create_task(
+        executar_periodicamente("varredura_atrasos", VARREDURA_ATRASOS_INTERVALO_SEGUNDOS, varredura_atrasos.executar)
+    ))
+    tarefas_periodicas.append(asyncio.create_task(
+        executar_periodicamente("compactacao_exclusoes", SYNC_COMPACTACAO_INTERVALO_SEGUNDOS, lambda: compactar_exclusoes(db))
+    ))
+    # Invalidação dos caches locais por escritas feitas em outros workers
+    if CHANGE_STREAMS_ATIVO:
+        tarefas_periodicas.append(asyncio.create_task(ouvinte_alteracoes.executar()))
+
+@app.on_event("shutdown")
+async def parar_tarefas_periodicas():
+    for tarefa in tarefas_periodicas:
+        tarefa.cancel()
+    # Espera os finally (ex.: o ouvinte salva o resume token) antes do client.close()
+    await asyncio.gather(*tarefas_periodicas, return_exceptions=True)
+    await gerador_notificacoes.digest.descarregar_todas()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+    encerrar_pools_senha()
@@ -0,0 +1,261 @@
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+from pymongo import ReturnDocument, UpdateOne
+import os
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Coleções cujas leituras são consultadas em polling pelo frontend
+COLECOES_VERSIONADAS = ("contratos", "projetos", "tarefas")
+
+# Callbacks locais chamados quando uma coleção muda (ex.: limpar caches)
+_ouvintes: Dict[str, List[Callable[[str], None]]] = {}
+
+
+def ao_alterar(colecoes: Iterable[str], callback: Callable[[str], None]):
+    """Registra callback chamado com o nome da coleção a cada alteração"""
+    for colecao in colecoes:
+        _ouvintes.setdefault(colecao, []).append(callback)
+
+
+def notificar_alteracao(*colecoes: str):
+    """Dispara os callbacks das coleções alteradas"""
+    for colecao in set(colecoes):
+        for callback in _ouvintes.get(colecao, []):
+            try:
+                callback(colecao)
+            except Exception as e:
+                logger.error(f"Erro ao notificar alteração em {colecao}: {str(e)}")
+
+
+async def incrementar_versoes(db, *colecoes: str):
+    """
+    Avança a versão das coleções alteradas
+
+    Deve ser chamada depois de toda escrita em contratos, projetos ou
+    tarefas. Os contadores ficam em `versoes_colecoes` (um documento por
+    coleção), então todos os workers enxergam a mesma versão; os ouvintes
+    locais (`ao_alterar`) são avisados na hora.
+
+    Também libera as sequências reservadas pelas escritas que acabaram de
+    terminar (ver `carimbo_alteracao`).
+    """
+    await liberar_reservas(db)
+    if not colecoes:
+        return
+    await db.versoes_colecoes.bulk_write([
+        UpdateOne({"_id": colecao}, {"$inc": {"versao": 1}}, upsert=True)
+        for colecao in set(colecoes)
+    ], ordered=False)
+    notificar_alteracao(*colecoes)
+
+
+async def obter_versoes(db, colecoes: Iterable[str]) -> dict:
+    """Versão atual de cada coleção (0 se nunca alterada)"""
+    colecoes = list(colecoes)
+    versoes = {colecao: 0 for colecao in colecoes}
+    async for doc in db.versoes_colecoes.find({"_id": {"$in": colecoes}}):
+        versoes[doc['_id']] = doc.get('versao', 0)
+    return versoes
+
+
+async def etag_versoes(db, colecoes: Iterable[str], *extra) -> str:
+    """
+    ETag forte derivada das versões das coleções e dos parâmetros da consulta
+
+    Muda sempre que uma das coleções é escrita; custa uma leitura pequena
+    em vez de buscar e serializar os documentos.
+    """
+    versoes = await obter_versoes(db, colecoes)
+    base = "|".join(f"{c}:{v}" for c, v in sorted(versoes.items()))
+    base += "|" + "|".join("" if e is None else str(e) for e in extra)
+    return '"' + hashlib.sha1(base.encode()).hexdigest()[:24] + '"'
+
+
+def etag_corresponde(if_none_match: Optional[str], etag: str) -> bool:
+    """Compara o header If-None-Match com a ETag atual"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidatos = [c.strip() for c in if_none_match.split(",")]
+    # If-None-Match usa comparação fraca: ignora o prefixo W/
+    return any((c[2:] if c.startswith("W/") else c) == etag for c in candidatos)
+
+
+# ============ SEQUÊNCIA DE ALTERAÇÕES (SYNC) ============
+
+SYNC_RETENCAO_EXCLUSOES_DIAS = int(os.getenv("SYNC_RETENCAO_EXCLUSOES_DIAS", "30"))
+# Prazo máximo de uma escrita entre reservar a sequência e gravar. Reservas
+# não liberadas (erro no meio da rota, escrita em task separada) seguram o
+# cursor do sync só até expirar; uma escrita mais lenta que isso pode ser
+# perdida pelo sync incremental, por isso os clientes devem refazer um sync
+# completo (since=0) de tempos em tempos
+SYNC_RESERVA_SEGUNDOS = int(os.getenv("SYNC_RESERVA_SEGUNDOS", "60"))
+SYNC_LIMITE = int(os.getenv("SYNC_LIMITE", "5000"))
+SYNC_COMPACTACAO_INTERVALO_SEGUNDOS = int(os.getenv("SYNC_COMPACTACAO_INTERVALO", str(60 * 60 * 24)))
+
+# Sequências reservadas pela requisição/tarefa atual e ainda não liberadas
+_reservas_pendentes: ContextVar[Optional[List[int]]] = ContextVar("reservas_sync", default=None)
+
+
+async def carimbo_alteracao(db) -> dict:
+    """
+    Campos gravados em toda escrita de contratos, projetos e tarefas
+
+    `seq` vem de um contador global monotônico em `versoes_colecoes`. No
+    mesmo update atômico a sequência entra em `reservas` (escrita ainda não
+    gravada); `incrementar_versoes`, chamada depois das escritas, libera as
+    reservas da requisição. O sync nunca entrega um cursor além da menor
+    reserva em aberto, então uma escrita que reservou cedo e gravou tarde
+    não é pulada.
+    """
+    agora = datetime.utcnow()
+    contador = await db.versoes_colecoes.find_one_and_update(
+        {"_id": "sequencia"},
+        [
+            {"$set": {"versao": {"$add": [{"$ifNull": ["$versao", 0]}, 1]}}},
+            {"$set": {"reservas": {"$concatArrays": [
+                # Aproveita o update para descartar reservas expiradas
+                {"$filter": {
+                    "input": {"$ifNull": ["$reservas", []]},
+                    "cond": {"$gt": ["$$this.expira_em", agora]}
+                }},
+                [{"seq": "$versao", "expira_em": agora + timedelta(seconds=SYNC_RESERVA_SEGUNDOS)}]
+            ]}}}
+        ],
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    seq = contador['versao']
+
+    pendentes = _reservas_pendentes.get()
+    if pendentes is None:
+        pendentes = []
+        _reservas_pendentes.set(pendentes)
+    pendentes.append(seq)
+    return {"updated_at": agora.isoformat(), "seq": seq}
+
+
+async def liberar_reservas(db):
+    """Libera as sequências reservadas pela requisição atual (escritas já gravadas)"""
+    pendentes = _reservas_pendentes.get()
+    if not pendentes:
+        return
+    seqs = list(pendentes)
+    pendentes.clear()
+    await db.versoes_colecoes.update_one(
+        {"_id": "sequencia"},
+        {"$pull": {"reservas": {"seq": {"$in": seqs}}}}
+    )
+
+
+def sequencia_confirmada(controle: dict) -> int:
+    """
+    Maior sequência até a qual todas as escritas já foram gravadas
+
+    É a sequência atual, recuada para antes da menor reserva em aberto.
+    """
+    agora = datetime.utcnow()
+    abertas = [
+        reserva['seq'] for reserva in controle.get('reservas', [])
+        if reserva.get('expira_em') and reserva['expira_em'] > agora
+    ]
+    atual = controle.get('versao', 0)
+    return min(atual, min(abertas) - 1) if abertas else atual
+
+
+async def registrar_exclusoes(db, colecao: str, ids: List[str], carimbo: dict):
+    """Grava marcas de exclusão para o sync avisar os clientes"""
+    if not ids:
+        return
+    excluido_em = datetime.utcnow()
+    await db.exclusoes.insert_many([
+        {"colecao": colecao, "id": id_, "seq": carimbo['seq'], "excluido_em": excluido_em}
+        for id_ in ids
+    ])
+
+
+async def criar_indices_sync(db):
+    """Índices por `seq` usados pelo GET /sync"""
+    for colecao in COLECOES_VERSIONADAS:
+        # Documentos anteriores ao sync recebem uma sequência (uma só por
+        # coleção), senão ficariam fora da paginação por `seq`
+        if await db[colecao].find_one({"seq": {"$exists": False}}, {"_id": 1}):
+            await db[colecao].update_many({"seq": {"$exists": False}}, {"$set": await carimbo_alteracao(db)})
+            await liberar_reservas(db)
+        await db[colecao].create_index("seq")
+    await db.exclusoes.create_index("seq")
+
+
+async def alteracoes_desde(db, since: int, limite: int = SYNC_LIMITE) -> dict:
+    """
+    Contratos, projetos, tarefas e exclusões alterados depois de `since`
+
+    - since=0 (ou cursor anterior às exclusões já compactadas) começa do
+      zero com `completo: true`; o cliente deve substituir seus dados
+    - Cada página traz até `limite` registros por coleção, em ordem de
+      `seq`. `cursor` é a maior sequência entregue por completo; com
+      `mais: true` o cliente pede de novo com since=cursor até vir `false`
+    - O cursor nunca passa de `sequencia_confirmada`: escritas que
+      reservaram sequência mas ainda não gravaram ficam para o próximo sync
+    """
+    controle = await db.versoes_colecoes.find_one({"_id": "sequencia"}) or {}
+    confirmada = sequencia_confirmada(controle)
+    completo = since <= 0 or since < controle.get('exclusoes_compactadas_ate', 0)
+
+    filtro = {"seq": {"$gt": 0 if completo else since, "$lte": confirmada}}
+    fontes = {colecao: (db[colecao], {"_id": 0}) for colecao in COLECOES_VERSIONADAS}
+    if not completo:
+        fontes["exclusoes"] = (db.exclusoes, {"_id": 0, "colecao": 1, "id": 1, "seq": 1})
+
+    lotes = {}
+    truncados = set()
+    cursor = confirmada
+    for nome, (colecao, projecao) in fontes.items():
+        lotes[nome] = await colecao.find(filtro, projecao).sort("seq", 1).to_list(limite)
+        if len(lotes[nome]) >= limite:
+            truncados.add(nome)
+            cursor = min(cursor, lotes[nome][-1]['seq'])
+
+    for nome in truncados:
+        # Um update_many grava a mesma seq em vários documentos: a seq do
+        # corte é buscada inteira para não ficar pela metade
+        colecao, projecao = fontes[nome]
+        lotes[nome] = [d for d in lotes[nome] if d['seq'] < cursor]
+        lotes[nome] += await colecao.find({"seq": cursor}, projecao).to_list(None)
+    for nome in fontes:
+        if nome not in truncados:
+            lotes[nome] = [d for d in lotes[nome] if d['seq'] <= cursor]
+
+    resultado = {"cursor": cursor, "completo": completo, "mais": cursor < confirmada}
+    for colecao in COLECOES_VERSIONADAS:
+        resultado[colecao] = lotes[colecao]
+
+    resultado["exclusoes"] = {colecao: [] for colecao in COLECOES_VERSIONADAS}
+    for exclusao in lotes.get("exclusoes", []):
+        resultado["exclusoes"].setdefault(exclusao['colecao'], []).append(exclusao['id'])
+    return resultado
+
+
+async def compactar_exclusoes(db) -> int:
+    """
+    Remove marcas de exclusão antigas
+
+    Guarda a maior sequência removida: clientes com cursor anterior a ela
+    recebem sync completo, pois podem ter perdido exclusões.
+    """
+    limite = datetime.utcnow() - timedelta(days=SYNC_RETENCAO_EXCLUSOES_DIAS)
+    ultima = await db.exclusoes.find_one({"excluido_em": {"$lt": limite}}, sort=[("seq", -1)])
+    if not ultima:
+        return 0
+    result = await db.exclusoes.delete_many({"seq": {"$lte": ultima['seq']}})
+    await db.versoes_colecoes.update_one(
+        {"_id": "sequencia"},
+        {"$max": {"exclusoes_compactadas_ate": ultima['seq']}},
+        upsert=True
+    )
+    return result.deleted_count
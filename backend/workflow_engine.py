@@ -5,6 +5,7 @@ from models import (
     ContratoStatus, EtapaProjeto, TarefaStatus, NivelRisco,
     Log, OperacaoResponse
 )
+from versoes import carimbo_alteracao
 import logging
 
 logger = logging.getLogger(__name__)
@@ -12,8 +13,9 @@ logger = logging.getLogger(__name__)
 class WorkflowEngine:
     """Motor de Workflow e Governança do IDEIABH"""
     
-    def __init__(self, db):
+    def __init__(self, db, gerador_notificacoes=None):
         self.db = db
+        self.gerador_notificacoes = gerador_notificacoes
     
     # ============ VALIDAÇÕES DE FLUXO ============
     
@@ -84,6 +86,11 @@ class WorkflowEngine:
         """Calcula o progresso do projeto baseado nas tarefas"""
         
         tarefas = await self.db.tarefas.find({"projeto_id": projeto_id}).to_list(1000)
+        return self.calcular_progresso(tarefas)
+    
+    @staticmethod
+    def calcular_progresso(tarefas: List[dict]) -> float:
+        """Progresso a partir das tarefas já carregadas"""
         
         if not tarefas:
             return 0.0
@@ -102,6 +109,12 @@ class WorkflowEngine:
         if not projeto:
             return NivelRisco.BAIXO
         
+        return self.classificar_risco(tarefas, projeto)
+    
+    @staticmethod
+    def classificar_risco(tarefas: List[dict], projeto: dict) -> NivelRisco:
+        """Nível de risco a partir das tarefas e do projeto já carregados"""
+        
         agora = datetime.utcnow()
         pontos_risco = 0
         
@@ -219,6 +232,7 @@ class WorkflowEngine:
             tarefa_dict = tarefa.dict()
             tarefa_dict['prazo'] = tarefa_dict['prazo'].isoformat()
             tarefa_dict['created_at'] = tarefa_dict['created_at'].isoformat()
+            tarefa_dict.update(await carimbo_alteracao(self.db))
             
             await self.db.tarefas.insert_one(tarefa_dict)
             tarefas_criadas.append(tarefa)
@@ -274,7 +288,12 @@ class WorkflowEngine:
     # ============ NOTIFICAÇÕES ============
     
     async def criar_notificacao(self, destinatario: str, assunto: str, corpo: str, tipo: str) -> Notificacao:
-        """Cria uma notificação (preparado para envio de e-mail)"""
+        """
+        Cria uma notificação (preparado para envio de e-mail)
+        
+        O documento de e-mail fica em `notificacoes`; se o destinatário for um
+        usuário do sistema, a notificação também entra na caixa de entrada dele.
+        """
         
         notificacao = Notificacao(
             destinatario=destinatario,
@@ -288,6 +307,9 @@ class WorkflowEngine:
         
         await self.db.notificacoes.insert_one(notif_dict)
         
+        if self.gerador_notificacoes is not None:
+            await self.gerador_notificacoes.notificar_destinatario(destinatario, tipo, assunto, corpo)
+        
         logger.info(f"Notificação criada: {assunto} para {destinatario}")
         
         return notificacao
@@ -72,8 +72,8 @@ const Notificacoes = () => {
 
   const handleNotificacaoClick = (notificacao) => {
     marcarComoLida(notificacao.id);
-    if (notificacao.tarefa_id) {
-      navigate('/tarefas');
+    if (notificacao.link) {
+      navigate(notificacao.link);
     }
     setOpen(false);
   };
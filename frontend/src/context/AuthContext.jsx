@@ -14,6 +14,71 @@ export const useAuth = () => {
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Access token é de curta duração: ao receber 401, renova com o refresh token
+// uma única vez (requisições simultâneas compartilham a mesma renovação)
+let renovacaoEmAndamento = null;
+
+const renovarToken = async () => {
+  const tokenUsado = axios.defaults.headers.common['Authorization'];
+
+  const renovar = async () => {
+    // Outra aba já renovou (o localStorage é compartilhado): usa o par gravado por ela
+    const tokenAtual = localStorage.getItem('token');
+    if (tokenAtual && `Bearer ${tokenAtual}` !== tokenUsado) {
+      axios.defaults.headers.common['Authorization'] = `Bearer ${tokenAtual}`;
+      return tokenAtual;
+    }
+
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (!refreshToken) throw new Error('Sem refresh token');
+
+    const response = await axios.post(`${API}/auth/refresh`, { refresh_token: refreshToken });
+    const { access_token, refresh_token } = response.data;
+
+    localStorage.setItem('token', access_token);
+    localStorage.setItem('refresh_token', refresh_token);
+    axios.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
+    return access_token;
+  };
+
+  // Entre abas: uma renovação por vez (Web Locks); sem suporte, o backend
+  // ainda aceita o mesmo refresh token por alguns segundos após a rotação
+  return navigator.locks ? navigator.locks.request('ideiabh-renovacao-token', renovar) : renovar();
+};
+
+// Mantém o header em dia quando outra aba renova ou faz logout
+window.addEventListener('storage', (evento) => {
+  if (evento.key !== 'token') return;
+  if (evento.newValue) {
+    axios.defaults.headers.common['Authorization'] = `Bearer ${evento.newValue}`;
+  } else {
+    delete axios.defaults.headers.common['Authorization'];
+  }
+});
+
+axios.interceptors.response.use(
+  (response) => response,
+  async (error) => {
+    const original = error.config;
+    const ehRotaAuth = ['/auth/login', '/auth/refresh', '/auth/logout'].some((rota) => original?.url?.includes(rota));
+    if (error.response?.status !== 401 || !original || original._renovado || ehRotaAuth) {
+      return Promise.reject(error);
+    }
+
+    try {
+      renovacaoEmAndamento = renovacaoEmAndamento || renovarToken();
+      const novoToken = await renovacaoEmAndamento;
+      original._renovado = true;
+      original.headers = { ...original.headers, Authorization: `Bearer ${novoToken}` };
+      return axios(original);
+    } catch (erroRenovacao) {
+      return Promise.reject(error);
+    } finally {
+      renovacaoEmAndamento = null;
+    }
+  }
+);
+
 export const AuthProvider = ({ children }) => {
   const [user, setUser] = useState(null);
   const [loading, setLoading] = useState(true);
@@ -53,11 +118,12 @@ export const AuthProvider = ({ children }) => {
         },
       });
 
-      const { access_token, user } = response.data;
+      const { access_token, refresh_token, user } = response.data;
       
       setToken(access_token);
       setUser(user);
       localStorage.setItem('token', access_token);
+      localStorage.setItem('refresh_token', refresh_token);
       localStorage.setItem('user', JSON.stringify(user)); // Salvar dados do usuário
       axios.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
       
@@ -80,11 +146,12 @@ export const AuthProvider = ({ children }) => {
         role: 'Atendimento'
       });
 
-      const { access_token, user } = response.data;
+      const { access_token, refresh_token, user } = response.data;
       
       setToken(access_token);
       setUser(user);
       localStorage.setItem('token', access_token);
+      localStorage.setItem('refresh_token', refresh_token);
       localStorage.setItem('user', JSON.stringify(user)); // Salvar dados do usuário
       axios.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
       
@@ -99,9 +166,14 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    const refreshToken = localStorage.getItem('refresh_token');
+    if (refreshToken) {
+      axios.post(`${API}/auth/logout`, { refresh_token: refreshToken }).catch(() => {});
+    }
     setUser(null);
     setToken(null);
     localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
     localStorage.removeItem('user'); // Remover dados do usuário
     delete axios.defaults.headers.common['Authorization'];
   };
@@ -95,10 +95,19 @@ const AdminUsers = () => {
   const fetchUsers = async () => {
     try {
       const token = getToken();
-      const response = await axios.get(`${API}/admin/users`, {
-        headers: { Authorization: `Bearer ${token}` }
-      });
-      setUsers(response.data);
+      const headers = { Authorization: `Bearer ${token}` };
+      const [response, registro] = await Promise.all([
+        axios.get(`${API}/admin/users`, { headers }),
+        axios.get(`${API}/admin/permissoes`, { headers })
+      ]);
+      // permissoes_mask: bit N = registro.data[N] (aritmética sem operadores
+      // bitwise, que em JS truncam em 32 bits)
+      setUsers(response.data.map((u) => ({
+        ...u,
+        permissoes: Object.fromEntries(
+          registro.data.map((nome, bit) => [nome, Math.floor((u.permissoes_mask || 0) / 2 ** bit) % 2 === 1])
+        )
+      })));
     } catch (error) {
       toast({
         title: 'Erro',
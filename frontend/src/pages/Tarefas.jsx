@@ -16,46 +16,30 @@ const Tarefas = () => {
   const [projetos, setProjetos] = useState([]);
   const [projetoSelecionado, setProjetoSelecionado] = useState(null);
   const [kanban, setKanban] = useState(null);
+  const [indicadores, setIndicadores] = useState(null);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
-    carregarProjetos();
+    carregarQuadro();
   }, []);
 
-  useEffect(() => {
-    if (projetoSelecionado) {
-      carregarKanban();
-    }
-  }, [projetoSelecionado]);
-
-  const carregarProjetos = async () => {
+  // Seletor, kanban, progresso e risco numa única requisição
+  const carregarQuadro = async (projetoId) => {
     try {
       const token = localStorage.getItem('token');
-      const response = await axios.get(`${API}/projetos`, {
-        headers: { Authorization: `Bearer ${token}` }
+      const response = await axios.get(`${API}/quadro`, {
+        headers: { Authorization: `Bearer ${token}` },
+        params: projetoId ? { projeto_id: projetoId } : {}
       });
-      setProjetos(response.data);
-      if (response.data.length > 0) {
-        setProjetoSelecionado(response.data[0].id);
-      }
+      setProjetos(response.data.projetos);
+      setProjetoSelecionado(response.data.projeto_id);
+      setKanban(response.data.kanban);
+      setIndicadores({ progresso: response.data.progresso, risco: response.data.risco });
       setLoading(false);
     } catch (error) {
-      console.error('Erro ao carregar projetos:', error);
-      toast({ title: 'Erro ao carregar projetos', variant: 'destructive' });
-      setLoading(false);
-    }
-  };
-
-  const carregarKanban = async () => {
-    try {
-      const token = localStorage.getItem('token');
-      const response = await axios.get(`${API}/tarefas/kanban/${projetoSelecionado}`, {
-        headers: { Authorization: `Bearer ${token}` }
-      });
-      setKanban(response.data);
-    } catch (error) {
-      console.error('Erro ao carregar kanban:', error);
+      console.error('Erro ao carregar quadro:', error);
       toast({ title: 'Erro ao carregar tarefas', variant: 'destructive' });
+      setLoading(false);
     }
   };
 
@@ -110,7 +94,7 @@ const Tarefas = () => {
         toast({ title: '✅ Tarefa movida com sucesso!' });
       }
       
-      carregarKanban();
+      carregarQuadro(projetoSelecionado);
     } catch (error) {
       console.error('Erro ao mover tarefa:', error);
       toast({ 
@@ -156,8 +140,14 @@ const Tarefas = () => {
             <h1 className="page-title">Kanban de Tarefas</h1>
             <p className="page-subtitle">Arraste as tarefas entre as colunas para atualizar o progresso</p>
           </div>
+          {indicadores && indicadores.risco && (
+            <div className="flex items-center gap-2">
+              <Badge variant="outline">{indicadores.progresso}% concluído</Badge>
+              <Badge variant="outline">Risco {indicadores.risco}</Badge>
+            </div>
+          )}
           <div className="w-64">
-            <Select value={projetoSelecionado} onValueChange={setProjetoSelecionado}>
+            <Select value={projetoSelecionado} onValueChange={carregarQuadro}>
               <SelectTrigger>
                 <SelectValue placeholder="Selecione um projeto" />
               </SelectTrigger>